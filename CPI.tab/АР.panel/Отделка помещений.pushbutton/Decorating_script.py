@@ -1,20 +1,30 @@
 # -*- coding: utf-8 -*-
 """Description"""
 
-from Autodesk.Revit.DB import BuiltInCategory as bic
-from collections import namedtuple
-from pyrevit import script, forms
+from cpi.probe import StartupProbe, count
+probe = StartupProbe()
+
+from cpi import decor_batch, decor_engine, snapshot
+from cpi.core import FEET_TO_MM, MM_TO_FEET, F2_TO_M2, \
+    Lazy, count_elements, get_collector, lazy_import, sidecar_path
+from cpi.decor_cache import DecorCache, fingerprint
+from cpi.decor_columns import SegmentTable
+from cpi.decor_engine import Aperture, Segment
+from cpi.decor_index import ApertureIndex, ApertureSizes, BoundaryIndex
+from cpi.export import QuantityExport
+from cpi.params import Lookuper, ParamCache, ParamWriter, lookup, value_of
+from cpi.report import PagedTable
 import Autodesk.Revit.DB as db
 
+script = lazy_import('pyrevit.script')
+forms = lazy_import('pyrevit.forms')
+
 doc = __revit__.ActiveUIDocument.Document
 uidoc = __revit__.ActiveUIDocument
-output = script.get_output()
-
-FEET_TO_MM = 304.8
-FEET_TO_M = 304.8 / 1000
-MM_TO_FEET = 1 / FEET_TO_MM
-M_TO_FEET = 1 / FEET_TO_M
-F2_TO_M2 = FEET_TO_MM**2 / 10**6
+output = Lazy(lambda: script.get_output())
+params_cache = ParamCache()
+writer = ParamWriter()
+probe.mark('Импорт')
 
 # Значение, после превышения которого скрипт будет вычитать площадь отбойника
 # из площади чистовой отделки
@@ -27,6 +37,64 @@ REPORT_ON = not __shiftclick__
 # REPORT_ON = __shiftclick__  # Отчёт не выводится. Shift + Клик включает вывод отчёта
 # ↑↑↑ ↑↑↑ ↑↑↑ ↑↑↑ Раскомментируй эту строку ↑↑↑ ↑↑↑ ↑↑↑ ↑↑↑
 
+REPORT_PAGE_SIZE = 10  # Количество помещений на одной странице отчёта
+REPORT_SUMMARY = False  # Краткий отчёт: одна строка на помещение
+# REPORT_SUMMARY = True
+# Выгрузка объёмов (помещения, участки стен, проёмы, плинтус, отбойник,
+# фартук) в файл <имя модели>.cpi_decor.csv или .jsonl рядом с моделью
+# вместо отчёта в окне вывода. Файл пишется построчно, по мере обхода помещений
+REPORT_FORMAT = 'html'
+# REPORT_FORMAT = 'csv'  # Таблица с разделителем ";" для Excel
+# REPORT_FORMAT = 'jsonl'  # Одна строка JSON на помещение
+
+# Помещения без изменений берутся из кэша (*.cpi_decor.json рядом с моделью)
+CACHE_ON = True
+# CACHE_ON = False  # Полный пересчёт всех помещений
+# Сверка пересчитанных помещений: расчётное ядро cpi.decor_engine против
+# колоночного расчёта cpi.decor_columns пакетного режима и снимков
+PARITY_ON = False
+# PARITY_ON = True
+PROBE_ON = __forceddebugmode__  # Ctrl + Клик выводит замер времени запуска
+PROBE_SLOWEST = 5  # Количество самых долгих помещений в замере
+TRACE_ON = False  # Запись замера в JSON рядом с моделью (*.cpi_trace.json)
+# TRACE_ON = PROBE_ON
+
+# Пакетный расчёт: данные помещений считываются из модели, а площади
+# и длины считаются ядром cpi.decor_engine в нескольких потоках
+BATCH_ON = False
+# BATCH_ON = True
+BATCH_WORKERS = 4  # Количество потоков пакетного расчёта
+# Бинарный снимок всех помещений (выбранных или всех в модели, в том числе
+# из кэша, с нулевой площадью и с выключенным "CPI_Подсчёт отделки") рядом
+# с моделью (*.cpi_snapshot.bin): границы, проёмы, параметры CPI_* для
+# расчёта и группировки вне Revit, например python -m cpi.decor_batch.
+# Включает пакетный расчёт
+SNAPSHOT_ON = False
+
+# Запись порциями: каждые COMMIT_CHUNK посчитанных помещений записываются
+# отдельной транзакцией и отмечаются в кэше. Прерванный или отменённый
+# запуск при повторном запуске продолжается с последней записанной порции
+COMMIT_CHUNK = 0  # Все помещения записываются одной транзакцией
+# COMMIT_CHUNK = 500
+
+# Параметры помещения, от которых зависит расчёт (входят в отпечаток)
+ROOM_INPUTS = [
+    'Номер',
+    'Имя',
+    'Стадия',
+    'Полная высота',
+    'CPI_Потолок_Высота',
+    'CPI_Плинтус_Наличие',
+    'CPI_Плинтус_Описание',
+    'CPI_Отбойник_Наличие',
+    'CPI_Отбойник_Ширина',
+    'CPI_Отбойник_Отметка верха',
+    'CPI_Отбойник_Запас',
+    'CPI_Фартук_Наличие',
+    'CPI_Фартук_Ширина',
+    'CPI_Фартук_Высота',
+]
+
 
 def to_mm(feet_val):
     return round(feet_val * FEET_TO_MM, 0)
@@ -40,52 +108,6 @@ def flatten(two_dim_list):  # https://stackoverflow.com/a/952952
     return [item for sublist in two_dim_list for item in sublist]
 
 
-class Lookuper(object):  # https://stackoverflow.com/a/16185009
-    """Wrapper for adding a bit of syntactic sugar to Elements.
-    Allows to use the new method "el.Look" instead of a bulky
-    "el.LookupParameter", due to it's unhandiness in term of necessity
-    of thinkig about the type of a returning value."""
-
-    def __init__(self, obj):
-        self.obj = obj
-
-    def __getattr__(self, name):
-        if name == 'Look':
-            return lambda s: None if not \
-                self.obj.LookupParameter(s) \
-                else self.obj.LookupParameter(s).AsDouble() if \
-                str(self.obj.LookupParameter(s).StorageType) == 'Double' \
-                else self.obj.LookupParameter(s).AsString() if \
-                str(self.obj.LookupParameter(s).StorageType) == 'String' \
-                else self.obj.LookupParameter(s).AsElementId() if \
-                str(self.obj.LookupParameter(s).StorageType) == 'ElementId' \
-                else self.obj.LookupParameter(s).AsInteger() if \
-                str(self.obj.LookupParameter(s).StorageType) == 'Integer' \
-                else None
-        return getattr(self.obj, name)
-
-    def __str__(self):
-        return self.obj.__repr__()
-
-
-def get_area(el):
-    return get_width(el) * get_height(el)
-
-
-def get_width(el):
-    symbol = Lookuper(el.Symbol)
-    width = el.Look('Ширина') or el.Look('Примерная ширина') or \
-        symbol.Look('Ширина') or symbol.Look('Примерная ширина')
-    return width
-
-
-def get_height(el):
-    symbol = Lookuper(el.Symbol)
-    height = el.Look('Высота') or el.Look('Примерная высота') or \
-        symbol.Look('Высота') or symbol.Look('Примерная высота')
-    return height
-
-
 errs = {}  # Supposed to be {message: Set(element_ids_as_integer_value)}
 
 
@@ -100,160 +122,357 @@ def errors(message, element_ids=None):
 
 
 def parse_baseboard_height(room):
-    param = room.Look('CPI_Плинтус_Описание')
-    if not param:
-        return 0
-    description = param.replace('мм', '').replace('=', '').replace(',', '').replace('.', '')
-    digits = [int(s) for s in description.split() if s.isdigit()]
-    return digits[0] if digits else 0
-
-
-def valid(instance):
-    if not instance:
-        return False
-    if instance.Category.Name == '<Разделитель помещений>':
-        return False
-    if instance.LookupParameter('Семейство').AsValueString() == 'Витраж':
-        return False
-    return True
-
-
-Segment = namedtuple('Segment', [
-    'length',
-    'decor_base',
-    'apertures',
-    'host_id',
-    'seg_prep_decor_area',
-])
-
-
-class Room():  # Основной расчёт помещений
-    """Wrapper for calculating the decorating of room"""
-    objects = []
-
-    def __init__(self, room):
-        self.__class__.objects.append(self)
-        self.origin = room
-        self.Id = room.Id
-        self.full_heigth = room.Look("Полная высота")
-        self.perim = room.Look("Периметр")
-        self.ceiling_heigth = room.Look("CPI_Потолок_Высота") \
-            or self.full_heigth
-        self.final_decor_heigth = min(self.ceiling_heigth + 100 * MM_TO_FEET,
-                                      self.full_heigth)
-        self.segments = []
-        self.apertures_area = 0
-        self.prep_decor_area = {}  # Supposed to be {decor_base: Area}
-        self.final_decor_area = 0
-        self.baseboard_on = room.Look("CPI_Плинтус_Наличие")
-        self.baseboard_lenth = 0
-        self.baseboard_height = parse_baseboard_height(room) * MM_TO_FEET
-        self.guard_on = room.Look("CPI_Отбойник_Наличие")
-        self.guard_width = room.Look("CPI_Отбойник_Ширина")
-        self.guard_height = room.Look("CPI_Отбойник_Отметка верха")
-        self.guard_reserve = room.Look("CPI_Отбойник_Запас") or 0
-        self.guard_lenth = 0 + self.guard_reserve
-        self.apron_on = room.Look("CPI_Фартук_Наличие")
-        self.apron_width = room.Look("CPI_Фартук_Ширина")
-        self.apron_height = room.Look("CPI_Фартук_Высота")
-        self.apron_area = self.apron_width \
-            * self.apron_height if self.apron_on else 0
-        self.aperture_ids = []
-        for segment in flatten(
-                room.GetBoundarySegments(db.SpatialElementBoundaryOptions())):
-            instance = doc.GetElement(segment.ElementId)
-            if not valid(instance):
+    return decor_engine.parse_baseboard_height(
+        room.Look('CPI_Плинтус_Описание'))
+
+
+def get_fingerprint(room, segments):
+    """Fingerprint of everything the calculation of the room depends on."""
+    values = [GUARD_THRESHOLD] + [room.Look(name) for name in ROOM_INPUTS]
+    apertures_by_host = aperture_index.for_room(
+        room.Look('Стадия').IntegerValue, room.Id.IntegerValue)
+    for element_id, length in segments:
+        host_id = element_id.IntegerValue
+        values += [host_id, length]
+        if not boundary_index.valid[host_id]:
+            continue
+        values.append(boundary_index.decor_base(host_id))
+        for ap in apertures_by_host.get(host_id, []):
+            values += list(aperture_sizes.get(ap))
+    return fingerprint(values)
+
+
+def extract_room(room, segments):
+    """Plain RoomData of the room for the calculation engine"""
+    apertures_by_host = aperture_index.for_room(
+        room.Look('Стадия').IntegerValue, room.Id.IntegerValue)
+    aperture_ids = set()
+    segments_data = []
+    for element_id, length in segments:
+        host_id = element_id.IntegerValue
+        if not boundary_index.valid[host_id]:
+            continue
+        apertures = []
+        for ap in apertures_by_host.get(host_id, []):
+            if ap.Id.IntegerValue in aperture_ids:
                 continue
-            symbol = Lookuper(doc.GetElement(instance.GetTypeId()))
-            decor_base = symbol.Look('CPI_Основа черновой отделки')
-            if not decor_base:
-                errors('Параметр "CPI_Основа черновой отделки" не заполнен, \
-                        расчёт черновой отделки некорректен',
-                       instance.Id.IntegerValue)
-                # continue
-                decor_base = '???'
-            length = segment.GetCurve().Length
-            if decor_base not in self.prep_decor_area:
-                self.prep_decor_area[decor_base] = 0
-            host_id = segment.ElementId.IntegerValue
-            apertures_ = apertures_by_host.get(host_id, [])
-            apertures = []
-            phase = doc.GetElement(room.Look('Стадия'))
-            for ap in apertures_:
-                if ap.Id in self.aperture_ids:
-                    continue
-                if (ap.FromRoom[phase] and ap.FromRoom[phase].Id.IntegerValue == room.Id.IntegerValue) \
-                        or (ap.ToRoom[phase] and ap.ToRoom[phase].Id.IntegerValue == room.Id.IntegerValue):
-                    self.aperture_ids.append(ap.Id)
-                    apertures.append(ap)
-            self.baseboard_lenth += length if self.baseboard_on else 0
-            self.guard_lenth += length if self.guard_on else 0
-            for ap in apertures:
-                ap_sill_height = ap.get_Parameter(
-                    db.BuiltInParameter.INSTANCE_SILL_HEIGHT_PARAM).AsDouble()
-                if self.baseboard_on:
-                    if self.baseboard_height > ap_sill_height:
-                        self.baseboard_lenth -= get_width(ap)
-                if self.guard_on:
-                    if self.guard_height > ap_sill_height:
-                        self.guard_lenth -= get_width(ap)
-            apertures_area = sum([get_area(ap) for ap in apertures])
-            seg_prep_decor_area = length * self.full_heigth - apertures_area
-            self.prep_decor_area[decor_base] += seg_prep_decor_area
-            final_decor_area = \
-                length * self.final_decor_heigth - apertures_area
-            self.final_decor_area += final_decor_area
-            self.segments.append(Segment(
-                length=length,
-                decor_base=decor_base,
-                apertures=apertures,
-                host_id=db.ElementId(host_id),
-                seg_prep_decor_area=seg_prep_decor_area,
-            ))
-        if self.guard_width >= GUARD_THRESHOLD:
-            self.final_decor_area -= self.guard_width * self.guard_lenth
-        self.final_decor_area -= self.apron_area
-        self.number = room.Look("Номер")
-
-    def commit(self):  # Прописывание значений параметров
-        self.origin.LookupParameter('CPI_Чистовая_Площадь отделки') \
-            .Set(self.final_decor_area)
+            aperture_ids.add(ap.Id.IntegerValue)
+            apertures.append(aperture_sizes.get(ap))
+        segments_data.append(decor_engine.SegmentData(
+            host_id=host_id,
+            length=length,
+            decor_base=boundary_index.decor_base(host_id),
+            apertures=apertures,
+        ))
+    return decor_engine.RoomData(
+        id=room.Id.IntegerValue,
+        number=room.Look("Номер"),
+        name=room.Look("Имя"),
+        full_heigth=room.Look("Полная высота"),
+        ceiling_heigth=room.Look("CPI_Потолок_Высота"),
+        baseboard_on=room.Look("CPI_Плинтус_Наличие"),
+        baseboard_height=parse_baseboard_height(room) * MM_TO_FEET,
+        guard_on=room.Look("CPI_Отбойник_Наличие"),
+        guard_width=room.Look("CPI_Отбойник_Ширина"),
+        guard_height=room.Look("CPI_Отбойник_Отметка верха"),
+        guard_reserve=room.Look("CPI_Отбойник_Запас"),
+        apron_on=room.Look("CPI_Фартук_Наличие"),
+        apron_width=room.Look("CPI_Фартук_Ширина"),
+        apron_height=room.Look("CPI_Фартук_Высота"),
+        segments=segments_data,
+    )
+
+
+# Поля Room, сохраняемые в кэше вместе с участками стен
+RECORD_FIELDS = [
+    'number',
+    'name',
+    'full_heigth',
+    'final_decor_heigth',
+    'prep_decor_area',
+    'final_decor_area',
+    'baseboard_lenth',
+    'baseboard_height',
+    'guard_width',
+    'guard_height',
+    'guard_reserve',
+    'guard_lenth',
+    'apron_width',
+    'apron_height',
+    'apron_area',
+]
+
+
+class Room(object):  # Основной расчёт помещений
+    """Wrapper for calculating the decorating of room.
+    The quantities come from cpi.decor_engine, the only implementation of
+    the calculation. Holds only ids and numbers: segments and apertures
+    refer to elements by integer ids, origin is released once the room
+    is committed."""
+    __slots__ = ['origin', 'id', 'cached', 'fingerprint', 'segments'] \
+        + RECORD_FIELDS
+
+    def __init__(self, room, segments):
+        self.origin = room
+        self.id = room.Id.IntegerValue
+        self.cached = False
+        data = extract_room(room, segments)
+        result = decor_engine.calculate(data, GUARD_THRESHOLD)
+        for name in ['number', 'name', 'full_heigth', 'baseboard_height',
+                     'guard_width', 'guard_height', 'apron_width',
+                     'apron_height']:
+            setattr(self, name, getattr(data, name))
+        self.guard_reserve = data.guard_reserve or 0
+        for name in result._fields:
+            setattr(self, name, getattr(result, name))
+
+    @classmethod
+    def from_record(cls, room, record):
+        """Room restored from the cache without any calculation"""
+        self = cls.__new__(cls)
+        self.origin = room
+        self.id = room.Id.IntegerValue
+        self.cached = True
+        for name in RECORD_FIELDS:
+            setattr(self, name, record[name])
+        self.segments = [Segment(
+            length=length,
+            decor_base=decor_base,
+            apertures=[Aperture(ap_id, area) for ap_id, area in apertures],
+            host_id=host_id,
+            seg_prep_decor_area=seg_prep_decor_area,
+        ) for length, decor_base, host_id, seg_prep_decor_area, apertures
+            in record['segments']]
+        return self
+
+    def to_record(self):
+        record = dict([(name, getattr(self, name)) for name in RECORD_FIELDS])
+        record['segments'] = [[
+            seg.length,
+            seg.decor_base,
+            seg.host_id,
+            seg.seg_prep_decor_area,
+            [[ap.Id, ap.area] for ap in seg.apertures],
+        ] for seg in self.segments]
+        return record
+
+    def outputs(self):
+        """Values of the parameters to be written: {name: value}"""
+        values = {
+            'CPI_Чистовая_Площадь отделки': self.final_decor_area,
+            'CPI_Плинтус_Длина': self.baseboard_lenth,
+            'CPI_Отбойник_Длина': self.guard_lenth,
+        }
+        for seg in self.segments:
+            name = 'CPI_Черновая-' + seg.decor_base + '_Площадь'
+            values[name] = values.get(name, 0) + seg.seg_prep_decor_area
+        return values
+
+    def is_committed(self):
+        """Whether the model still holds the values of this room"""
+        for name, value in self.outputs().items():
+            current = self.origin.Look(name)
+            if current is None or abs(current - value) > 1e-6:
+                return False
+        return True
+
+    def commit(self):  # Прописывание изменившихся значений параметров
+        writer.set(self.origin, 'CPI_Чистовая_Площадь отделки',
+                   self.final_decor_area)
         areas = {}  # Supposed to be {decor_base: [Area, ElementIds]}
         for seg in self.segments:
             if seg.decor_base not in areas:
                 areas[seg.decor_base] = [0, []]  # [Area, ElementIds]
             areas[seg.decor_base][0] += seg.seg_prep_decor_area
-            areas[seg.decor_base][1].append(seg.host_id.IntegerValue)
+            areas[seg.decor_base][1].append(seg.host_id)
         for base in areas:
-            par = self.origin.LookupParameter(
-                'CPI_Черновая-' + base + '_Площадь')
-            if par:
-                par.Set(areas[base][0])
-            else:
+            name = 'CPI_Черновая-' + base + '_Площадь'
+            if writer.set(self.origin, name, areas[base][0]) is None:
                 errors('Не найден параметр "CPI_Черновая-{0}_Площадь", \
                         значение площади для "{0}" не записано'.format(base),
                        areas[base][1])
-        self.origin.LookupParameter('CPI_Плинтус_Длина') \
-            .Set(self.baseboard_lenth)
-        self.origin.LookupParameter('CPI_Отбойник_Длина') \
-            .Set(self.guard_lenth)
+        writer.set(self.origin, 'CPI_Плинтус_Длина', self.baseboard_lenth)
+        writer.set(self.origin, 'CPI_Отбойник_Длина', self.guard_lenth)
+        self.origin = None  # Элемент Revit больше не нужен
 
 
-def pack_apertures_by_host(apertures):
-    apertures_by_host = {}
-    for ap in apertures:
-        host_id = ap.Host.Id.IntegerValue
-        if host_id not in apertures_by_host:
-            apertures_by_host[host_id] = []
-        apertures_by_host[host_id].append(ap)
-    return apertures_by_host
+def render_room(room, i):  # Строка подробного отчёта
+    finish_area = 'Sч = {:n} м²'.format(to_sq(room.final_decor_area))
+    prep_areas = '<br>'\
+        .join([finish_area] + ['S{} = {:n} м²'.format(
+            decor_base.lower(),
+            to_sq(room.prep_decor_area[decor_base])
+        )
+            for decor_base in room.prep_decor_area])
+    room_info = '{}<br>{} {}<br>{}' \
+        .format(i + 1,
+                output.linkify(db.ElementId(room.id), room.number),
+                room.name,
+                prep_areas,
+                )
+    walls_info = []
+    apertures_info = []
+    segs_area = 0
+    aps_area = 0
+    perim = 0
+    for i_seg, seg in enumerate(room.segments):
+        seg_area = to_sq(seg.length * room.final_decor_heigth)
+        segs_area += seg_area
+        perim += seg.length
+        # if len(rooms) < 4:
+        room_mark = output.linkify(db.ElementId(seg.host_id),
+                                   '{} {}'.format(i_seg + 1, seg.decor_base))
+        # else:
+            # room_mark = '{} {}'.format(i_seg + 1, seg.decor_base)
+        walls_info.append(
+            '{}: L = {:n} ({:n}), h = {:n} ({:n}), S = {:n} ({:n})'.format(
+                room_mark,
+                to_mm(seg.length),
+                to_mm(perim),
+                to_mm(room.final_decor_heigth),
+                to_mm(room.full_heigth),
+                seg_area,
+                segs_area)
+        )
+        for i_ap, ap in enumerate(seg.apertures):
+            ap_area = to_sq(ap.area)
+            aps_area += ap_area
+            apertures_info.append(
+                '{} S = {:n} ({:n})'.format(
+                    output.linkify(db.ElementId(ap.Id),
+                                   '{}.{}'.format(i_seg + 1, i_ap + 1)),
+                    ap_area,
+                    aps_area)
+            )
+    baseboard_info = '{:n}<br>h={:n}'.format(
+        to_mm(room.baseboard_lenth),
+        to_mm(room.baseboard_height)
+    )
+    diff = room.guard_lenth - room.guard_reserve
+    guardrail_info = \
+        '{:n}{}<br>Ш = {:n} мм<br>Отм. в. {:n} мм<br>S = {:n} м²'.format(
+            to_mm(room.guard_lenth),
+            ' =<br>{:n}{}{:n}'.format(
+                to_mm(diff),
+                ' + ' if room.guard_reserve > 0 else ' ',
+                to_mm(room.guard_reserve)) if room.guard_reserve else '',
+            to_mm(room.guard_width),
+            to_mm(room.guard_height),
+            to_sq(room.guard_width * room.guard_lenth),
+        )
+    apron_info = '{:n} м² =<br>{:n}×{:n}'.format(
+        to_sq(room.apron_area),
+        to_mm(room.apron_width),
+        to_mm(room.apron_height),
+    )
+    return [room_info,
+            '<br>'.join(walls_info),
+            '<br>'.join(apertures_info),
+            baseboard_info,
+            guardrail_info,
+            apron_info,
+            ]
+
+
+def render_room_summary(room, i):  # Строка краткого отчёта
+    return [
+        '{}. {} {}'.format(i + 1, output.linkify(db.ElementId(room.id), room.number),
+                           room.name),
+        '{:n}'.format(to_sq(room.final_decor_area)),
+        '<br>'.join(['{} = {:n}'.format(base, to_sq(area))
+                     for base, area in room.prep_decor_area.items()]),
+        '{:n}'.format(to_mm(room.baseboard_lenth)),
+        '{:n}'.format(to_mm(room.guard_lenth)),
+        '{:n}'.format(to_sq(room.apron_area)),
+    ]
+
+
+REPORT_COLUMNS = [
+    'Помещение, м²',
+    'Стены: Длина, мм (Σмм); Высота (черновая), мм; Площадь, м² (Σм²)',
+    'Проёмы: площадь, м² (Σм²)',
+    'Плинтус',
+    '<p title="Пороговая ширина отбойника для учёта его площади в'
+    + 'чистовой отделке составляет {0:n} мм">Отбойник {0:n}</p>'
+    .format(GUARD_THRESHOLD * FEET_TO_MM),
+    'Фартук',
+]
+
+SUMMARY_COLUMNS = [
+    'Помещение',
+    'Чистовая, м²',
+    'Черновая, м²',
+    'Плинтус, мм',
+    'Отбойник, мм',
+    'Фартук, м²',
+]
+
+
+def commit_rooms(rooms, name='Отделка'):
+    """Write the calculated rooms in one transaction and put them into
+    the cache."""
+    if not rooms:  # Все помещения из кэша, транзакция не нужна
+        return
+    written = sum(writer.written.values())
+    t = db.Transaction(doc, name)
+    t.Start()
+    for room in rooms:
+        with probe.timing('Id {}: запись'.format(room.id)):
+            room.commit()
+    written = sum(writer.written.values()) - written
+    if written:
+        t.Commit()
+    else:
+        t.RollBack()  # Ничего не изменилось, журнал отмены не засоряется
+    probe.transaction(t.GetName(), written)
+    for room in rooms:
+        decor_cache.put(room.id, room.fingerprint, room.to_record())
+
+
+def commit_chunk(rooms):
+    """Write a chunk of rooms and checkpoint the cache after it"""
+    if rooms:
+        commit_rooms(rooms, 'Отделка: порция {}'.format(
+            decor_cache.checkpoints + 1))
+        decor_cache.checkpoint()
 
 
-def get_collector(cat_name, to_elements=True):
-    return list(db.FilteredElementCollector(doc)
-                  .OfCategory(getattr(bic, cat_name))
-                  .WhereElementIsNotElementType()
-                  .ToElements())
+def snapshot_sides(rooms):
+    """{aperture_id: (from_room_id, to_room_id)} in the phases of the rooms"""
+    sides = {}
+    for phase_id in set([room.Look('Стадия').IntegerValue
+                         for room in rooms]):
+        sides.update(aperture_index.sides_of(phase_id))
+    return sides
+
+
+def snapshot_params(rooms):
+    """{name: (str(StorageType), [value by room])} of the CPI_* parameters
+    of the rooms, ElementId values by IntegerValue"""
+    storages = {}  # Supposed to be {name: str(StorageType)}
+    rows = []
+    for room in rooms:
+        row = {}
+        for param in room.Parameters:
+            name = param.Definition.Name
+            if not name.startswith('CPI_'):
+                continue
+            storages[name] = str(param.StorageType)
+            row[name] = value_of(param)
+            if storages[name] == 'ElementId':
+                row[name] = row[name].IntegerValue
+        rows.append(row)
+    return dict([(name, (storage, [row.get(name) for row in rows]))
+                 for name, storage in storages.items()])
+
+
+def restore_room(room, record):
+    """Room from the cache or None if its values were changed in the model"""
+    cached = Room.from_record(room, record)
+    if not cached.is_committed():
+        return None
+    cached.origin = None  # Помещение не записывается, элемент не нужен
+    return cached
 
 
 # ----------------------------------------------------------------------------
@@ -261,36 +480,120 @@ def get_collector(cat_name, to_elements=True):
 # ----------------------------------------------------------------------------
 
 
-doors = get_collector('OST_Doors')
-windows = get_collector('OST_Windows')
-apertures = [Lookuper(el) for el in doors + windows if el.Host]
-apertures_by_host = pack_apertures_by_host(apertures)
 sel = [doc.GetElement(elid) for elid in uidoc.Selection.GetElementIds()]
+count('GetElement', len(sel))
 rooms = [el for el in sel if el.Category.Name == 'Помещения']
-all_rooms = get_collector('OST_Rooms')
-rooms = rooms or all_rooms
-
-t = db.Transaction(doc, 'Отделка: Простановка галочек помещениям')
-t.Start()
+# При выбранных помещениях собираются только их стены и проёмы в них
+scoped = bool(rooms)
+rooms = rooms or get_collector(doc, 'OST_Rooms')
+# Итоги отчёта считаются сразу, чтобы не держать все элементы до конца
+rooms_total = len(rooms)  # Выбранные или все помещения
+rooms_zero = len([r for r in rooms if r.Area == 0])
+# Снимок содержит все помещения, а не только посчитанные
+snapshot_rooms = [Lookuper(r, params_cache) for r in rooms] \
+    if SNAPSHOT_ON else []
+
+empty_params = []  # Supposed to be [(Parameter, param_name)]
 for room in rooms:
     for param_name in ['CPI_Плинтус_Наличие',
                        'CPI_Фартук_Наличие',
                        'CPI_Отбойник_Наличие',
                        'CPI_Подсчёт отделки']:
-        param = room.LookupParameter(param_name)
+        param = lookup(room, param_name)
         if not param.HasValue:
-            param.Set(1)
-t.Commit()
+            empty_params.append((param, param_name))
+        # Отпечаток и отбор помещений берут значение из кэша параметров
+        params_cache.put(room, param_name,
+                         param.AsInteger() if param.HasValue else 1)
+if empty_params:
+    t = db.Transaction(doc, 'Отделка: Простановка галочек помещениям')
+    t.Start()
+    for param, param_name in empty_params:
+        writer.set_param(param, param_name, 1)
+    t.Commit()
+    probe.transaction(t.GetName(), len(empty_params))
+
+rooms = [r for r in rooms if params_cache.look(r, 'CPI_Подсчёт отделки')]
+rooms_off = rooms_total - len(rooms)
+
+title = 'Сбор границ помещений'
+boundaries = {}  # Supposed to be {room_id: [(ElementId, Length)]}
+phase_ids = []
+with forms.ProgressBar(title=title, cancellable=True) as pb:
+    options = db.SpatialElementBoundaryOptions()
+    for i, room in enumerate(rooms):
+        if room.Area > 0:
+            count('GetBoundarySegments')
+            boundaries[room.Id.IntegerValue] = [
+                (segment.ElementId, segment.GetCurve().Length)
+                for segment in flatten(room.GetBoundarySegments(options))]
+            phase_ids.append(Lookuper(room, params_cache).Look('Стадия'))
+        if pb.cancelled:
+            break
+        else:
+            pb.update_progress(i, len(rooms))
 
-rooms = [r for r in rooms if r.LookupParameter('CPI_Подсчёт отделки').AsInteger()]
+if pb.cancelled:
+    script.exit()
+
+boundary_index = BoundaryIndex(doc, params_cache)
+boundary_index.add(element_id for segments in boundaries.values()
+                   for element_id, length in segments)
+if boundary_index.no_decor_base:
+    errors('Параметр "CPI_Основа черновой отделки" не заполнен, \
+            расчёт черновой отделки некорректен',
+           boundary_index.no_decor_base)
+if scoped:
+    apertures = boundary_index.inserts(['OST_Doors', 'OST_Windows'])
+else:
+    apertures = [el for el in get_collector(doc, 'OST_Doors')
+                 + get_collector(doc, 'OST_Windows') if el.Host]
+apertures = [Lookuper(el, params_cache) for el in apertures]
+aperture_index = ApertureIndex(doc, apertures, phase_ids)
+aperture_sizes = ApertureSizes(params_cache)
+decor_cache = DecorCache(
+    sidecar_path(doc, '.cpi_decor.json')
+    or script.get_document_data_file('cpi_decor', 'json'),
+    enabled=CACHE_ON)
+probe.mark('Подготовка')
 
 title = 'Основной расчёт'
 rooms_ = []
+pending = []  # Supposed to be [(index in rooms_, room, fingerprint, RoomData)]
+chunk = []  # Посчитанные, но ещё не записанные помещения
+parity_count = 0
 with forms.ProgressBar(title=title, cancellable=True) as pb:
     i = 0
     for room in rooms:
         if room.Area > 0:
-            rooms_.append(Room(Lookuper(room)))
+            room_ = Lookuper(room, params_cache)
+            segments = boundaries[room.Id.IntegerValue]
+            with probe.timing('Id {}: расчёт'.format(room.Id.IntegerValue)):
+                key = get_fingerprint(room_, segments)
+                cached = decor_cache.get(
+                    room.Id.IntegerValue, key,
+                    lambda record: restore_room(room_, record))
+                if cached:
+                    rooms_.append(cached)
+                elif BATCH_ON or SNAPSHOT_ON:  # Расчёт после чтения всех
+                    pending.append((len(rooms_), room_, key,
+                                    extract_room(room_, segments)))
+                    rooms_.append(None)
+                else:
+                    rooms_.append(Room(room_, segments))
+                    rooms_[-1].fingerprint = key
+                    chunk.append(rooms_[-1])
+            if PARITY_ON and rooms_[-1] and not cached:  # Сверка двух расчётов
+                parity_count += 1
+                if decor_engine.compare(rooms_[-1], SegmentTable([
+                        extract_room(room_, segments)]).results(
+                            GUARD_THRESHOLD)[0]):
+                    errors('Расчёт помещения ядром cpi.decor_engine не \
+                            совпадает с колоночным расчётом cpi.decor_columns',
+                           room.Id.IntegerValue)
+            if COMMIT_CHUNK and len(chunk) >= COMMIT_CHUNK:
+                commit_chunk(chunk)
+                chunk = []
             pb.title = '{}: {} из {}: Помещение № {}'.format(title,
                                                              i + 1,
                                                              len(rooms),
@@ -303,137 +606,100 @@ with forms.ProgressBar(title=title, cancellable=True) as pb:
 rooms = rooms_
 
 if pb.cancelled:
+    if COMMIT_CHUNK:  # Посчитанное сохраняется для следующего запуска
+        commit_chunk(chunk)
     script.exit()
 
-t = db.Transaction(doc, 'Отделка')
-t.Start()
-for room in rooms:
-    room.commit()
-t.Commit()
-
-title = 'Формирование отчёта'
-report = []  # Формирование отчёта
-with forms.ProgressBar(title=title, cancellable=True) as pb:
-    i = 0
-    for room in rooms:
-        if not REPORT_ON:
-            continue
-        finish_area = 'Sч = {:n} м²'.format(to_sq(room.final_decor_area))
-        prep_areas = '<br>'\
-            .join([finish_area] + ['S{} = {:n} м²'.format(
-                decor_base.lower(),
-                to_sq(room.prep_decor_area[decor_base])
-            )
-                for decor_base in room.prep_decor_area])
-        room_info = '{}<br>{} {}<br>{}' \
-            .format(i + 1,
-                    output.linkify(room.origin.Id,
-                                   room.origin.Look('Номер')),
-                    room.origin.Look('Имя'),
-                    prep_areas,
-                    )
-        walls_info = []
-        apertures_info = []
-        segs_area = 0
-        aps_area = 0
-        perim = 0
-        for i_seg, seg in enumerate(room.segments):
-            seg_area = to_sq(seg.length * room.final_decor_heigth)
-            segs_area += seg_area
-            perim += seg.length
-            # if len(rooms) < 4:
-            room_mark = output.linkify(seg.host_id, '{} {}'.format(i_seg + 1, seg.decor_base))
-            # else:
-                # room_mark = '{} {}'.format(i_seg + 1, seg.decor_base)
-            walls_info.append(
-                '{}: L = {:n} ({:n}), h = {:n} ({:n}), S = {:n} ({:n})'.format(
-                    room_mark,
-                    to_mm(seg.length),
-                    to_mm(perim),
-                    to_mm(room.final_decor_heigth),
-                    to_mm(room.full_heigth),
-                    seg_area,
-                    segs_area)
-            )
-            for i_ap, ap in enumerate(seg.apertures):
-                ap_area = to_sq(get_area(ap))
-                aps_area += ap_area
-                apertures_info.append(
-                    '{} S = {:n} ({:n})'.format(
-                        output.linkify(ap.Id, '{}.{}'.format(i_seg + 1,
-                                                             i_ap + 1)),
-                        ap_area,
-                        aps_area)
-                )
-        baseboard_info = '{:n}<br>h={:n}'.format(
-            to_mm(room.baseboard_lenth),
-            to_mm(room.baseboard_height)
-        )
-        diff = room.guard_lenth - room.guard_reserve
-        guardrail_info = \
-            '{:n}{}<br>Ш = {:n} мм<br>Отм. в. {:n} мм<br>S = {:n} м²'.format(
-                to_mm(room.guard_lenth),
-                ' =<br>{:n}{}{:n}'.format(
-                    to_mm(diff),
-                    ' + ' if room.guard_reserve > 0 else ' ',
-                    to_mm(room.guard_reserve)) if room.guard_reserve else '',
-                to_mm(room.guard_width),
-                to_mm(room.guard_height),
-                to_sq(room.guard_width * room.guard_lenth),
-            )
-        apron_info = '{:n} м² =<br>{:n}×{:n}'.format(
-            to_sq(room.apron_area),
-            to_mm(room.apron_width),
-            to_mm(room.apron_height),
-        )
-        report.append([room_info,
-                       '<br>'.join(walls_info),
-                       '<br>'.join(apertures_info),
-                       baseboard_info,
-                       guardrail_info,
-                       apron_info,
-                       ])
-
-        pb.title = '{}: {} из {}: Помещение № {}'.format(title,
-                                                         i + 1,
-                                                         len(rooms),
-                                                         room.number)
-        if pb.cancelled:
-            break
-        else:
-            pb.update_progress(i, len(rooms))
-        i += 1
+if pending:  # Пакетный расчёт, результаты в порядке помещений
+    room_data = [data for i, room_, key, data in pending]
+    records = decor_batch.compute_records(room_data, GUARD_THRESHOLD,
+                                          BATCH_WORKERS)
+    for (i, room_, key, data), record in zip(pending, records):
+        rooms[i] = Room.from_record(room_, record)
+        rooms[i].cached = False
+        rooms[i].fingerprint = key
+if SNAPSHOT_ON:
+    # Помещения без границ (нулевая площадь, расчёт выключен) без участков
+    extracted = dict([(data.id, data) for i, room_, key, data in pending])
+    snapshot.save(
+        sidecar_path(doc, snapshot.SUFFIX)
+        or script.get_document_data_file('cpi_snapshot', 'bin'),
+        [extracted.get(room_.Id.IntegerValue) or extract_room(
+            room_, boundaries.get(room_.Id.IntegerValue, []))
+         for room_ in snapshot_rooms],
+        GUARD_THRESHOLD,
+        snapshot_sides(snapshot_rooms), snapshot_params(snapshot_rooms),
+        [room_.Area for room_ in snapshot_rooms],
+        [room_.Look('CPI_Подсчёт отделки') for room_ in snapshot_rooms])
+# Обёртки элементов Revit больше не нужны: помещения держат только id
+pending = room_data = records = extracted = snapshot_rooms = None
+boundaries = boundary_index = apertures = aperture_index = aperture_sizes = None
+probe.mark('Расчёт')
+
+# Записанные порциями и восстановленные из кэша помещения уже без origin
+chunk = [room for room in rooms if room.origin is not None]
+if COMMIT_CHUNK:
+    title = 'Запись'
+    with forms.ProgressBar(title=title, cancellable=True) as pb:
+        for start in range(0, len(chunk), COMMIT_CHUNK):
+            commit_chunk(chunk[start:start + COMMIT_CHUNK])
+            if pb.cancelled:
+                break
+            else:
+                pb.update_progress(start + COMMIT_CHUNK, len(chunk))
+    if pb.cancelled:
+        script.exit()
+else:
+    commit_rooms(chunk)
+chunk = None
+decor_cache.save()
+cache_stats = decor_cache.stats()
+decor_cache = None  # Записи кэша сохранены, отчёту не нужны
+params_cache.invalidate()  # Отчёту значения параметров не нужны
+probe.mark('Запись')
 
 if REPORT_ON:
-    if report:
-        LIMIT = 10
-        reports = []
-        for i in range(len(report)):
-            if len(report) >= LIMIT:
-                reports.append(report[:LIMIT])
-                report = report[LIMIT:]
-            else:
-                reports.append(report) if report else None
+    title = 'Формирование отчёта'
+    if REPORT_FORMAT != 'html':
+        export_path = sidecar_path(doc, '.cpi_decor.' + REPORT_FORMAT) \
+            or script.get_document_data_file('cpi_decor', REPORT_FORMAT)
+        table = QuantityExport(export_path, REPORT_FORMAT)
+    elif REPORT_SUMMARY:
+        table = PagedTable(output, SUMMARY_COLUMNS, render_room_summary,
+                           REPORT_PAGE_SIZE)
+    else:
+        table = PagedTable(output, REPORT_COLUMNS, render_room,
+                           REPORT_PAGE_SIZE)
+    with forms.ProgressBar(title=title, cancellable=True) as pb, table:
+        for i, room in enumerate(rooms):
+            table.add(room)  # Вывод отчёта
+            pb.title = '{}: {} из {}: Помещение № {}'.format(title,
+                                                             i + 1,
+                                                             len(rooms),
+                                                             room.number)
+            if pb.cancelled:
                 break
-        for report in reports:
-            output.print_table(  # Вывод отчёта
-                table_data=report,
-                columns=[
-                    'Помещение, м²',
-                    'Стены: Длина, мм (Σмм); Высота (черновая), мм; Площадь, м² (Σм²)',
-                    'Проёмы: площадь, м² (Σм²)',
-                    'Плинтус',
-                    '<p title="Пороговая ширина отбойника для учёта его площади в'
-                    + 'чистовой отделке составляет {0:n} мм">Отбойник {0:n}</p>'
-                    .format(GUARD_THRESHOLD * FEET_TO_MM),
-                    'Фартук',
-                ]
-            )
-    rooms_off = [r for r in all_rooms if not r.LookupParameter('CPI_Подсчёт отделки').AsInteger()]
-    print('\nПомещений в проекте всего: {}'.format(len(all_rooms)))
-    print('Помещений с нулевой площадью: {}'.format(len([r for r in all_rooms if r.Area == 0])))
-    print('Помещений с выключенным "CPI_Подсчёт отделки": {}'.format(len(rooms_off)))
+            else:
+                pb.update_progress(i, len(rooms))
+
+    if REPORT_FORMAT != 'html':
+        print('Выгружено помещений: {} в файл {}'.format(table.count,
+                                                       export_path))
+    print('\nПомещений в проекте всего: {}'.format(
+        count_elements(doc, 'OST_Rooms') if scoped else rooms_total))
+    among = ''  # Итоги по всему проекту без выбора
+    if scoped:
+        print('Выбрано помещений: {}'.format(rooms_total))
+        among = ' среди выбранных'
+    print('Помещений с нулевой площадью{}: {}'.format(among, rooms_zero))
+    print('Помещений с выключенным "CPI_Подсчёт отделки"{}: {}'.format(
+        among, rooms_off))
     print('Обработано {}'.format(len(rooms)))
+    print(params_cache.stats())
+    print(cache_stats)
+    print(writer.stats())
+    if PARITY_ON:
+        print('Сверено помещений: {}'.format(parity_count))
 
 LIMIT = 50
 for message in errs:  # Вывод ошибок
@@ -452,3 +718,10 @@ for message in errs:  # Вывод ошибок
           + ' '.join([output.linkify(i) for i in el_ids])
           + (' ...' if too_big else '')
           )
+
+probe.mark('Отчёт')
+if PROBE_ON:
+    print('\nЗамер времени: ' + probe.summary(PROBE_SLOWEST))
+if TRACE_ON:
+    probe.dump(sidecar_path(doc, '.cpi_trace.json')
+               or script.get_document_data_file('cpi_trace', 'json'))
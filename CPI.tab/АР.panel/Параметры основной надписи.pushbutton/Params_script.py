@@ -1,70 +1,37 @@
 # -*- coding: utf-8 -*-
 
-from Autodesk.Revit.DB import BuiltInCategory as bic
-from collections import namedtuple
-from pyrevit import script, forms
-from System.Collections.Generic import *
+from cpi.probe import StartupProbe, count
+probe = StartupProbe()
+
+from cpi.core import Lazy, get_collector, lazy_import, natural_sorted, \
+    sidecar_path
+from cpi.params import Lookuper, ParamCache, ParamWriter, lookup, type_key, \
+    value_of
+from System.Collections.Generic import List
 import Autodesk.Revit.DB as db
-import re
+
+script = lazy_import('pyrevit.script')
+forms = lazy_import('pyrevit.forms')
 
 doc = __revit__.ActiveUIDocument.Document
 uidoc = __revit__.ActiveUIDocument
-output = script.get_output()
+output = Lazy(lambda: script.get_output())
+params_cache = ParamCache()
+writer = ParamWriter()
+probe.mark('Импорт')
 
 REPORT_ON = not 0
 JUST_SEL = __shiftclick__
+PROBE_ON = __forceddebugmode__  # Ctrl + Клик выводит замер времени запуска
+TRACE_ON = False  # Запись замера в JSON рядом с моделью (*.cpi_trace.json)
+# TRACE_ON = PROBE_ON
 
-
-class Lookuper(object):  # https://stackoverflow.com/a/16185009
-    """Wrapper for adding a bit of syntactic sugar to Elements.
-    Allows to use the new method "el.Look" instead of a bulky
-    "el.LookupParameter", due to it's unhandiness in term of necessity
-    of thinkig about the type of a returning value."""
-
-    def __init__(self, obj):
-        self.obj = obj
-
-    def __getattr__(self, name):
-        if name == 'Look':
-            return lambda s: None if not \
-                self.obj.LookupParameter(s) \
-                else self.obj.LookupParameter(s).AsDouble() if \
-                str(self.obj.LookupParameter(s).StorageType) == 'Double' \
-                else self.obj.LookupParameter(s).AsString() if \
-                str(self.obj.LookupParameter(s).StorageType) == 'String' \
-                else self.obj.LookupParameter(s).AsElementId() if \
-                str(self.obj.LookupParameter(s).StorageType) == 'ElementId' \
-                else self.obj.LookupParameter(s).AsInteger() if \
-                str(self.obj.LookupParameter(s).StorageType) == 'Integer' \
-                else None
-        return getattr(self.obj, name)
-
-    def __repr__(self):
-        return self.obj.__repr__() + '*'
-
-    def __str__(self):
-        return self.obj.__repr__() + '**'
-
-
-def get_collector(cat_name, to_elements=True):
-    return list(db.FilteredElementCollector(doc)
-                  .OfCategory(getattr(bic, cat_name))
-                  .WhereElementIsNotElementType()
-                  .ToElements())
-
-
-def natural_sorted(list, key=lambda s: s):
-    """
-    Sort the list into natural alphanumeric order.
-    """
-    def get_alphanum_key_func(key):
-        convert = lambda text: int(text) if text.isdigit() else text  # noqa
-        return lambda s: [convert(c) for c in re.split('([0-9]+)', key(s))]
-    sort_key = get_alphanum_key_func(key)
-    return sorted(list, key=sort_key)
+GRID_OPTION = 'Несколько параметров (таблица)'
 
 
 def str_param(param):
+    if not param:  # Основная надпись другого семейства
+        return ''
     if str(param.StorageType) == 'Double':
         val = param.AsDouble()
         if val:
@@ -96,6 +63,88 @@ def str_param(param):
         return val
 
 
+layouts = {}  # Supposed to be {type_key: (names of parameters, names of ALLOWED)}
+
+
+def get_layout(tb):
+    """Names of parameters of the title block sorted and filtered once
+    per title block type."""
+    key = type_key(tb)
+    if key not in layouts:
+        names = natural_sorted([p.Definition.Name for p in tb.Parameters])
+        allowed = [name for name in names if any([s in name for s in ALLOWED])]
+        layouts[key] = names, allowed
+    return layouts[key]
+
+
+def report_row(tb):
+    return [output.linkify(tb.Id, sheets[tb.OwnerViewId.IntegerValue].SheetNumber)] + \
+        [str_param(lookup(tb, name)) for name in get_layout(tb)[1]]
+
+
+def cell_text(param):
+    """Raw value of the parameter as it is shown in the grid."""
+    value = value_of(param)
+    if value is None:
+        return ''
+    if str(param.StorageType) == 'ElementId':
+        return str(value.IntegerValue)
+    return str(value)
+
+
+def parse_value(param, text):
+    if str(param.StorageType) == 'Double':
+        return float(text)
+    if str(param.StorageType) == 'Integer':
+        return int(text)
+    if str(param.StorageType) == 'ElementId':
+        return db.ElementId(int(text))
+    return text
+
+
+def edit_in_grid(tbs, names):
+    """Title blocks × parameters grid. Returns only the edited cells
+    {param_name: [(title_block, text)]}, None if cancelled."""
+    from System import DBNull
+    from System.Data import DataTable
+    from System.Windows.Controls import DataGridEditingUnit, DataGridTextColumn
+    from System.Windows.Data import Binding
+
+    class GridWindow(forms.WPFWindow):
+        def apply_click(self, sender, args):
+            self.grid.CommitEdit(DataGridEditingUnit.Row, True)
+            self.DialogResult = True
+
+    table = DataTable()
+    columns = ['sheet'] + ['c{}'.format(i) for i in range(len(names))]
+    for column in columns:
+        table.Columns.Add(column)
+    initial = []
+    for tb in tbs:
+        row = [sheets[tb.OwnerViewId.IntegerValue].SheetNumber] + \
+            [cell_text(lookup(tb, name)) for name in names]
+        initial.append(row)
+        table.Rows.Add(*row)
+
+    window = GridWindow(script.get_bundle_file('GridEditor.xaml'))
+    for column, header in zip(columns, ['Номер листа'] + names):
+        window.grid.Columns.Add(DataGridTextColumn(
+            Header=header, Binding=Binding(column),
+            IsReadOnly=column == 'sheet'))
+    window.grid.ItemsSource = table.DefaultView
+    if not window.ShowDialog():
+        return None
+
+    edits = {}
+    for tb, row, values in zip(tbs, table.Rows, initial):
+        for i, name in enumerate(names):
+            text = row[i + 1]
+            text = '' if isinstance(text, DBNull) else text
+            if text != values[i + 1]:
+                edits.setdefault(name, []).append((tb, text))
+    return edits
+
+
 # ----------------------------------------------------------------------------
 # ----------------------------------- Main -----------------------------------
 # ----------------------------------------------------------------------------
@@ -111,26 +160,32 @@ ALLOWED = [
     'Количество измов для',
 ]
 
-title_blocks = [Lookuper(el) for el in get_collector('OST_TitleBlocks')]
 sel = [doc.GetElement(elid) for elid in uidoc.Selection.GetElementIds()]
-sel = [el.Id for el in sel if el.LookupParameter('Категория').AsValueString() == 'Листы']
+count('GetElement', len(sel))
+sheets = {el.Id.IntegerValue: Lookuper(el, params_cache) for el in sel
+          if lookup(el, 'Категория').AsValueString() == 'Листы'}
 
-if not sel:
+if not sheets:
     script.exit()
 
+title_blocks = {}  # Supposed to be {sheet_id: [title_block]}
+for el in get_collector(doc, 'OST_TitleBlocks'):
+    sheet_id = el.OwnerViewId.IntegerValue
+    if sheet_id not in title_blocks:
+        title_blocks[sheet_id] = []
+    title_blocks[sheet_id].append(el)
+probe.mark('Подготовка')
+
+tbs = sorted([Lookuper(el, params_cache) for sheet_id in sheets
+              for el in title_blocks.get(sheet_id, [])],
+             key=lambda tb: tb.Id.IntegerValue)
+report = [report_row(tb) for tb in tbs]  # Формирование отчёта
 PARAMS = []
 PARAM_NAMES = []
-report = []  # Формирование отчёта
-tbs = []
-for tb in title_blocks:
-    owner = Lookuper(doc.GetElement(tb.OwnerViewId))
-    owner_id = tb.OwnerViewId
-    parameters = natural_sorted(tb.Parameters, lambda p: p.Definition.Name)
-    if owner_id in sel:
-        tbs.append(tb)
-        report.append([output.linkify(tb.Id, owner.SheetNumber)] + [str_param(p) for p in parameters if any([s in p.Definition.Name for s in ALLOWED])])
-        PARAMS = PARAMS or parameters
-        PARAM_NAMES = PARAM_NAMES or [p.Definition.Name for p in parameters if any([s in p.Definition.Name for s in ALLOWED])]
+if tbs:
+    PARAMS = [lookup(tbs[0], name) for name in get_layout(tbs[0])[0]]
+    PARAM_NAMES = get_layout(tbs[0])[1]
+probe.mark('Расчёт')
 
 if JUST_SEL:
     el_ids = List[db.ElementId]([el.Id for el in tbs])
@@ -139,6 +194,8 @@ if JUST_SEL:
 
 from collections import OrderedDict
 options_dict = OrderedDict()
+if tbs:
+    options_dict[GRID_OPTION] = None
 for p in PARAMS:
     options_dict[p.Definition.Name] = p
 selected_param_name = forms.CommandSwitchWindow.show(
@@ -146,7 +203,13 @@ selected_param_name = forms.CommandSwitchWindow.show(
     message='Выберите параметр (Esc для отчёта):',
     width=400
 )
-if selected_param_name:
+edits = {}  # Supposed to be {param_name: [(title_block, text)]}
+if selected_param_name == GRID_OPTION:
+    edits = edit_in_grid(tbs, [name for name in PARAM_NAMES
+                               if not lookup(tbs[0], name).IsReadOnly])
+    if edits is None:
+        script.exit()
+elif selected_param_name:
     selected_param = options_dict[selected_param_name]
     value = forms.ask_for_string(
         default=' '.join(natural_sorted(list(set(['<' + str(tb.Look(selected_param.Definition.Name)) + '>' for tb in tbs])))),
@@ -154,27 +217,43 @@ if selected_param_name:
         title='Параметры основной надписи')
     if value is None:
         script.exit()
-    if str(selected_param.StorageType) == 'Double':
-        value = float(value)
-    elif str(selected_param.StorageType) == 'Integer':
-        value = int(value)
-    elif str(selected_param.StorageType) == 'ElementId':
-        value = db.ElementId(int(value))
+    edits = {selected_param_name: [(tb, value) for tb in tbs]}
 
+errors = []
+if edits:
     t = db.Transaction(doc, 'Параметры основной надписи')
     t.Start()
-    for tb in tbs:
-        print(type(value))
-        print(value)
-        tb.LookupParameter(selected_param.Definition.Name).Set(value)
-    t.Commit()
-
-    if REPORT_ON:
-        report = []
-        for tb in tbs:
-            owner = Lookuper(doc.GetElement(tb.OwnerViewId))
-            parameters = natural_sorted(tb.Parameters, lambda p: p.Definition.Name)
-            report.append([output.linkify(tb.Id, owner.SheetNumber)] + [str_param(p) for p in parameters if any([s in p.Definition.Name for s in ALLOWED])])
+    for name, cells in edits.items():
+        for tb, text in cells:
+            param = lookup(tb, name)
+            if not param:  # Основная надпись другого семейства
+                errors.append([output.linkify(tb.Id), name, text,
+                               'Нет параметра'])
+                continue
+            if param.IsReadOnly:
+                errors.append([output.linkify(tb.Id), name, text,
+                               'Только для чтения'])
+                continue
+            try:
+                writer.set_param(param, name, parse_value(param, text))
+            except ValueError:
+                errors.append([output.linkify(tb.Id), name, text,
+                               'Неверное значение'])
+            except Exception as e:  # Исключение Revit при записи
+                errors.append([output.linkify(tb.Id), name, text, str(e)])
+    if writer.written:
+        t.Commit()
+    else:
+        t.RollBack()
+    probe.transaction(t.GetName(), sum(writer.written.values()))
+
+    if REPORT_ON:  # Перечитываются только изменённые столбцы
+        for name in edits:
+            if name not in PARAM_NAMES:
+                continue
+            column = PARAM_NAMES.index(name) + 1
+            for tb, row in zip(tbs, report):
+                row[column] = str_param(lookup(tb, name))
 
 if REPORT_ON:
     output.print_table(  # Вывод отчёта
@@ -183,3 +262,17 @@ if REPORT_ON:
             'Номер листа',
         ] + PARAM_NAMES
     )
+    if edits:
+        print(writer.stats())
+if errors:
+    output.print_table(
+        table_data=errors,
+        title='Значения не записаны',
+        columns=['Основная надпись', 'Параметр', 'Значение', 'Причина'])
+
+probe.mark('Ввод и отчёт')
+if PROBE_ON:
+    print('Замер времени: ' + probe.summary())
+if TRACE_ON:
+    probe.dump(sidecar_path(doc, '.cpi_trace.json')
+               or script.get_document_data_file('cpi_trace', 'json'))
@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+"""Упрощённая замена Autodesk.Revit.DB и pyrevit для бенчмарков.
+
+Only the pieces the CPI scripts touch are simulated: collectors by
+category, elements with named parameters, rooms with boundary segments,
+walls with inserts, doors and windows with FromRoom/ToRoom, sheets and
+title blocks, transactions, the output window, progress bars and the
+dialogs, which give the answers scripted in dialogs.
+install() registers the stand-ins in sys.modules, so the button scripts
+run unchanged under plain CPython."""
+
+import os
+import sys
+import tempfile
+import types
+
+# Supposed to be {category: (built-in category, localized name)}
+CATEGORIES = {
+    'OST_Rooms': (-2000160, 'Помещения'),
+    'OST_Walls': (-2000011, 'Стены'),
+    'OST_Doors': (-2000023, 'Двери'),
+    'OST_Windows': (-2000014, 'Окна'),
+    'OST_Sheets': (-2003100, 'Листы'),
+    'OST_TitleBlocks': (-2000280, 'Основные надписи'),
+    'OST_Phases': (-2000500, 'Стадии'),
+}
+
+
+class ElementId(object):
+    def __init__(self, value):
+        self.IntegerValue = int(value)
+
+    def __eq__(self, other):
+        return isinstance(other, ElementId) and \
+            other.IntegerValue == self.IntegerValue
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.IntegerValue)
+
+    def __str__(self):
+        return str(self.IntegerValue)
+
+
+INVALID_ID = ElementId(-1)
+
+
+class Category(object):
+    def __init__(self, name):
+        value, self.Name = CATEGORIES[name]
+        self.Id = ElementId(value)
+
+
+class Definition(object):
+    def __init__(self, name):
+        self.Name = name
+
+
+class Parameter(object):
+    """Named value; StorageType is taken from the type of the value."""
+
+    def __init__(self, name, value, storage=None, read_only=False):
+        self.Definition = Definition(name)
+        self.StorageType = storage or storage_of(value)
+        self.IsReadOnly = read_only
+        self.value = value
+
+    @property
+    def HasValue(self):
+        return self.value is not None
+
+    def AsDouble(self):
+        return float(self.value or 0)
+
+    def AsInteger(self):
+        return int(self.value or 0)
+
+    def AsString(self):
+        return self.value
+
+    def AsElementId(self):
+        return self.value if self.value is not None else INVALID_ID
+
+    def AsValueString(self):
+        if self.StorageType == 'Integer' and self.value in (0, 1):
+            return 'Да' if self.value else 'Нет'
+        return None if self.value is None else str(self.value)
+
+    def Set(self, value):
+        self.value = value
+        return True
+
+
+def storage_of(value):
+    if isinstance(value, bool) or isinstance(value, int):
+        return 'Integer'
+    if isinstance(value, float):
+        return 'Double'
+    if isinstance(value, ElementId):
+        return 'ElementId'
+    return 'String'
+
+
+class Element(object):
+    def __init__(self, doc, category, params=None, type_id=INVALID_ID):
+        self.Id = doc.new_id()
+        self.Category = Category(category) if category else None
+        self.type_id = type_id
+        self.params = {}
+        for name, value in (params or {}).items():
+            self.add(name, value)
+        doc.add(self)
+
+    def add(self, name, value, storage=None, read_only=False):
+        self.params[name] = Parameter(name, value, storage, read_only)
+
+    def LookupParameter(self, name):
+        return self.params.get(name)
+
+    def get_Parameter(self, built_in):
+        return self.params.get(built_in)
+
+    @property
+    def Parameters(self):
+        return list(self.params.values())
+
+    def GetTypeId(self):
+        return self.type_id
+
+
+class Curve(object):
+    def __init__(self, length):
+        self.Length = length
+
+
+class BoundarySegment(object):
+    def __init__(self, element_id, length):
+        self.ElementId = element_id
+        self.curve = Curve(length)
+
+    def GetCurve(self):
+        return self.curve
+
+
+class Room(Element):
+    def __init__(self, doc, number, area, params):
+        Element.__init__(self, doc, 'OST_Rooms', params)
+        self.Number = number
+        self.Area = area
+        self.add('Номер', number)
+        self.loops = []  # Supposed to be [[BoundarySegment]]
+
+    def GetBoundarySegments(self, options):
+        return self.loops
+
+
+class Wall(Element):
+    def __init__(self, doc, type_id, family='Базовая стена'):
+        Element.__init__(self, doc, 'OST_Walls', type_id=type_id)
+        self.add('Семейство', family)
+        self.inserts = []  # Supposed to be [ElementId]
+
+    def FindInserts(self, *flags):
+        return list(self.inserts)
+
+
+class ByPhase(object):
+    """FromRoom/ToRoom indexer: room[phase]"""
+
+    def __init__(self, room):
+        self.room = room
+
+    def __getitem__(self, phase):
+        return self.room
+
+
+class FamilyInstance(Element):
+    def __init__(self, doc, category, symbol, host, from_room, to_room,
+                 sill_height, params=None):
+        Element.__init__(self, doc, category, params, symbol.Id)
+        self.Symbol = symbol
+        self.Host = host
+        self.FromRoom = ByPhase(from_room)
+        self.ToRoom = ByPhase(to_room)
+        self.add(BuiltInParameter.INSTANCE_SILL_HEIGHT_PARAM, sill_height)
+        host.inserts.append(self.Id)
+
+
+class Sheet(Element):
+    def __init__(self, doc, number):
+        Element.__init__(self, doc, 'OST_Sheets')
+        self.SheetNumber = number
+        self.add('Категория', 'Листы')
+
+
+class TitleBlock(Element):
+    def __init__(self, doc, sheet, type_id, params):
+        Element.__init__(self, doc, 'OST_TitleBlocks', params, type_id)
+        self.OwnerViewId = sheet.Id
+
+
+class Document(object):
+    def __init__(self, path_name=''):
+        self.PathName = path_name
+        self.elements = {}  # Supposed to be {element_id: Element}
+        self.last_id = 1000
+
+    def new_id(self):
+        self.last_id += 1
+        return ElementId(self.last_id)
+
+    def add(self, element):
+        self.elements[element.Id.IntegerValue] = element
+
+    def GetElement(self, element_id):
+        return self.elements.get(element_id.IntegerValue)
+
+
+class Selection(object):
+    def __init__(self):
+        self.ids = []
+
+    def GetElementIds(self):
+        return list(self.ids)
+
+    def SetElementIds(self, ids):
+        self.ids = list(ids)
+
+
+class UIDocument(object):
+    def __init__(self, doc):
+        self.Document = doc
+        self.Selection = Selection()
+
+
+class UIApplication(object):
+    def __init__(self, doc):
+        self.ActiveUIDocument = UIDocument(doc)
+
+
+# --------------------------- Autodesk.Revit.DB ------------------------------
+
+class BuiltInCategory(object):
+    pass
+
+
+for _name, (_value, _) in CATEGORIES.items():
+    setattr(BuiltInCategory, _name, _value)
+
+
+class BuiltInParameter(object):
+    INSTANCE_SILL_HEIGHT_PARAM = 'INSTANCE_SILL_HEIGHT_PARAM'
+
+
+class FilteredElementCollector(object):
+    def __init__(self, doc):
+        self.doc = doc
+        self.elements = list(doc.elements.values())
+
+    def OfCategory(self, category):
+        self.elements = [el for el in self.elements if el.Category
+                         and el.Category.Id.IntegerValue == category]
+        return self
+
+    def WhereElementIsNotElementType(self):
+        return self
+
+    def ToElements(self):
+        return sorted(self.elements, key=lambda el: el.Id.IntegerValue)
+
+    def GetElementCount(self):
+        return len(self.elements)
+
+
+class SpatialElementBoundaryOptions(object):
+    pass
+
+
+class Transaction(object):
+    def __init__(self, doc, name):
+        self.name = name
+
+    def GetName(self):
+        return self.name
+
+    def Start(self):
+        pass
+
+    def Commit(self):
+        pass
+
+    def RollBack(self):
+        pass
+
+
+# ------------------------------- pyrevit ------------------------------------
+
+class Output(object):
+    """Output window: tables are rendered to text and dropped."""
+
+    def print_table(self, table_data, columns=None, title=None, **kwargs):
+        return '\n'.join(['|'.join([str(cell) for cell in row])
+                          for row in table_data])
+
+    def linkify(self, element_ids, title=None):
+        if isinstance(element_ids, (list, tuple)):
+            return '[{}]'.format(title or len(element_ids))
+        return '[{}]'.format(title or element_ids)
+
+
+cancel_at = {}  # Supposed to be {title of a ProgressBar: progress value}
+
+
+class ProgressBar(object):
+    """Pressing Cancel is scripted by cancel_at: the bar is cancelled
+    once its progress reaches the value given for its title."""
+
+    def __init__(self, title='', cancellable=False, **kwargs):
+        self.title = title
+        self.cancelled = False
+        self.cancel_at = cancel_at.get(title) if cancellable else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def update_progress(self, value, max_value=1):
+        if self.cancel_at is not None and value >= self.cancel_at:
+            self.cancelled = True
+
+
+dialogs = []  # Scripted answers of the following dialogs, in order
+
+
+def answer():
+    """Next scripted answer, None (Esc) when there are no more"""
+    return dialogs.pop(0) if dialogs else None
+
+
+class CommandSwitchWindow(object):
+    @staticmethod
+    def show(options, **kwargs):
+        choice = answer()
+        if choice is not None and choice not in options:
+            raise KeyError(choice)
+        return choice
+
+
+def ask_for_string(default=None, **kwargs):
+    return answer()
+
+
+class DataRows(list):
+    def Add(self, *values):
+        self.append(list(values))
+
+
+class DataColumns(list):
+    def Add(self, name):
+        self.append(name)
+
+
+class DataTable(object):
+    def __init__(self):
+        self.Columns = DataColumns()
+        self.Rows = DataRows()
+
+    @property
+    def DefaultView(self):
+        return self
+
+
+class DBNull(object):
+    pass
+
+
+class DataGridTextColumn(object):
+    def __init__(self, Header=None, Binding=None, IsReadOnly=False):
+        self.Header = Header
+        self.Binding = Binding
+        self.IsReadOnly = IsReadOnly
+
+
+class DataGridEditingUnit(object):
+    Row = 'Row'
+
+
+class Binding(object):
+    def __init__(self, path):
+        self.Path = path
+
+
+class DataGrid(object):
+    def __init__(self):
+        self.Columns = DataColumns()
+        self.ItemsSource = None
+
+    def CommitEdit(self, unit, exit_editing):
+        return True
+
+
+class WPFWindow(object):
+    """Window with a DataGrid. The scripted answer of ShowDialog is
+    {(row, column header): text} typed into the grid, None cancels."""
+
+    def __init__(self, xaml_file):
+        self.grid = DataGrid()
+        self.DialogResult = None
+
+    def ShowDialog(self):
+        edits = answer()
+        if edits is None:
+            return False
+        headers = [column.Header for column in self.grid.Columns]
+        for (row, header), text in edits.items():
+            self.grid.ItemsSource.Rows[row][headers.index(header)] = text
+        return True
+
+
+def exit():
+    raise SystemExit()
+
+
+def get_document_data_file(file_id, file_ext, add_cmd_name=False):
+    return os.path.join(tempfile.gettempdir(),
+                        'cpi_bench_{}.{}'.format(file_id, file_ext))
+
+
+def get_bundle_file(name):
+    return name
+
+
+def install():
+    """Register the stand-ins as Autodesk.Revit.DB, pyrevit and System"""
+    module = sys.modules[__name__]
+    autodesk = types.ModuleType('Autodesk')
+    revit = types.ModuleType('Autodesk.Revit')
+    db = types.ModuleType('Autodesk.Revit.DB')
+    for name in ['BuiltInCategory', 'BuiltInParameter', 'ElementId',
+                 'FilteredElementCollector', 'SpatialElementBoundaryOptions',
+                 'Transaction']:
+        setattr(db, name, getattr(module, name))
+    autodesk.Revit = revit
+    revit.DB = db
+
+    pyrevit = types.ModuleType('pyrevit')
+    script = types.ModuleType('pyrevit.script')
+    script.get_output = Output
+    script.exit = exit
+    script.get_document_data_file = get_document_data_file
+    script.get_bundle_file = get_bundle_file
+    forms = types.ModuleType('pyrevit.forms')
+    forms.ProgressBar = ProgressBar
+    forms.CommandSwitchWindow = CommandSwitchWindow
+    forms.ask_for_string = ask_for_string
+    forms.WPFWindow = WPFWindow
+    pyrevit.script = script
+    pyrevit.forms = forms
+
+    system = types.ModuleType('System')
+    system.DBNull = DBNull
+    collections = types.ModuleType('System.Collections')
+    generic = types.ModuleType('System.Collections.Generic')
+    generic.List = dict([(ElementId, list)])
+    system.Collections = collections
+    collections.Generic = generic
+    data = types.ModuleType('System.Data')
+    data.DataTable = DataTable
+    system.Data = data
+    windows = types.ModuleType('System.Windows')
+    controls = types.ModuleType('System.Windows.Controls')
+    controls.DataGridEditingUnit = DataGridEditingUnit
+    controls.DataGridTextColumn = DataGridTextColumn
+    windows_data = types.ModuleType('System.Windows.Data')
+    windows_data.Binding = Binding
+    system.Windows = windows
+    windows.Controls = controls
+    windows.Data = windows_data
+
+    sys.modules.update({
+        'Autodesk': autodesk,
+        'Autodesk.Revit': revit,
+        'Autodesk.Revit.DB': db,
+        'pyrevit': pyrevit,
+        'pyrevit.script': script,
+        'pyrevit.forms': forms,
+        'System': system,
+        'System.Collections': collections,
+        'System.Collections.Generic': generic,
+        'System.Data': data,
+        'System.Windows': windows,
+        'System.Windows.Controls': controls,
+        'System.Windows.Data': windows_data,
+    })
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Микробенчмарк группировки номеров помещений.
+
+Compares cpi.grouping.group_numbers with the former get_grouped_numbers
+of Nums_grouping_script.py on synthetic room numbers: the outputs must
+be byte-identical, the timings show how both scale. The second table
+groups buckets of multi-level numbers (section.floor.room, letters) of
+several targets one by one and through one shared NumberTrie.
+
+    python bench/grouping_bench.py [max_count]
+"""
+
+import os
+import random
+import re
+import sys
+from timeit import default_timer as clock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'lib'))
+
+from cpi.grouping import NumberTrie, group_numbers  # noqa: E402
+
+
+def legacy_natural_sorted(list, key=lambda s: s):
+    def get_alphanum_key_func(key):
+        convert = lambda text: int(text) if text.isdigit() else text  # noqa
+        return lambda s: [convert(c) for c in re.split('([0-9]+)', key(s))]
+    sort_key = get_alphanum_key_func(key)
+    return sorted(list, key=sort_key)
+
+
+class LegacyNumber:
+    def __init__(self, number):
+        self.origin = number
+        self.prefix = '.'.join(number.split('.')[0:-1])
+        self.base = number.split('.')[-1]
+        self.int = int(self.base)
+
+    def __str__(self):
+        return 'origin {}||prefix {}||base {}'.format(self.origin, self.prefix,
+                                                      self.base)
+
+
+def legacy_grouped_numbers(numbers):
+    """get_grouped_numbers() as it was before cpi.grouping"""
+    nums_by_prefix = {}
+    for number in legacy_natural_sorted(numbers):
+        numo = LegacyNumber(number)
+        if numo.prefix not in nums_by_prefix:
+            nums_by_prefix[numo.prefix] = []
+        nums_by_prefix[numo.prefix].append(numo)
+    groups = [[]]
+    for nums in nums_by_prefix.values():
+        for i, numo in enumerate(nums):
+            if len(nums) > 2:
+                if i > 0 and nums[i].int != nums[i - 1].int + 1:
+                    groups.append([])
+            groups[-1].append(numo)
+            if i == len(nums) - 1:
+                groups.append([])
+    results = []
+    groups = [group for group in groups if len(group) > 0]
+    groups = legacy_natural_sorted(groups, lambda x: x[0].origin)
+    temp = []
+    filtered_groups = []
+    for group in groups:
+        if len(group) == 1 and str(group[0]) in temp:
+            continue
+        else:
+            temp.append(str(group[0]))
+            filtered_groups.append(group)
+    for group in filtered_groups:
+        numo = group[0]
+        if numo.prefix:
+            if len(group) == 2:
+                s = '{0}.{1}, {0}.{2}'.format(numo.prefix, group[0].base, group[-1].base)
+                if group[0].base == group[-1].base:
+                    s = '{0}.{1}'.format(numo.prefix, group[0].base)
+            else:
+                if group[0].base != group[-1].base:
+                    s = '{0}.{1}÷{0}.{2}'.format(numo.prefix, group[0].base, group[-1].base)
+                else:
+                    s = '{}.{}'.format(numo.prefix, group[0].base)
+        else:
+            if len(group) == 2:
+                s = '{}, {}'.format(group[0].base, group[-1].base)
+                if group[0].base == group[-1].base:
+                    s = '{}'.format(group[0].base)
+            else:
+                if group[0].base != group[-1].base:
+                    s = '{}÷{}'.format(group[0].base, group[-1].base)
+                else:
+                    s = '{}'.format(group[0].base)
+        results.append(s)
+    return ', '.join(results)
+
+
+def synthetic_numbers(count, seed=0):
+    """Room numbers of a project: sections, floors, gaps and duplicates"""
+    rnd = random.Random(seed)
+    numbers = []
+    while len(numbers) < count:
+        prefix = rnd.choice(['', '{}'.format(rnd.randint(1, 9)),
+                             '{}.{}'.format(rnd.randint(1, 3),
+                                            rnd.randint(1, 20))])
+        start = rnd.randint(1, 50)
+        for base in range(start, start + rnd.randint(1, 30)):
+            if rnd.random() < 0.1:
+                continue
+            number = '{}.{}'.format(prefix, base) if prefix else str(base)
+            numbers.append(number)
+            if rnd.random() < 0.02:
+                numbers.append(number)
+    rnd.shuffle(numbers)
+    return numbers[:count]
+
+
+def sectioned_numbers(count, seed=0):
+    """Room numbers section.floor.room, some of them with letters"""
+    rnd = random.Random(seed)
+    numbers = []
+    for i in range(count):
+        number = '{}.{}.{:02d}'.format(i // 2000 + 1, i // 100 % 20 + 1,
+                                       i % 100 + 1)
+        numbers.append(number + 'а' if rnd.random() < 0.05 else number)
+    rnd.shuffle(numbers)
+    return numbers
+
+
+def sectioned_buckets(count, targets=8, kinds=20, seed=0):
+    """Indexes of rooms by kind for every target, like GroupingPlan"""
+    rnd = random.Random(seed)
+    buckets = []
+    for target in range(targets):
+        by_kind = {}
+        for index in range(count):
+            by_kind.setdefault(rnd.randint(1, kinds), []).append(index)
+        buckets += list(by_kind.values())
+    return buckets
+
+
+def by_buckets(numbers, buckets):
+    return [group_numbers([numbers[i] for i in indexes])
+            for indexes in buckets]
+
+
+def by_trie(numbers, buckets):
+    trie = NumberTrie(numbers)
+    return [trie.group(indexes) for indexes in buckets]
+
+
+def measure(func, numbers, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = clock()
+        result = func(numbers)
+        elapsed = clock() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(max_count=10000):
+    print('{:>8} {:>12} {:>12} {:>8}'.format('rooms', 'legacy, ms', 'new, ms',
+                                            'x'))
+    count = 10
+    while count <= max_count:
+        numbers = synthetic_numbers(count)
+        legacy_time, expected = measure(legacy_grouped_numbers, numbers)
+        new_time, actual = measure(group_numbers, numbers)
+        if actual != expected:
+            raise AssertionError('Output differs for {} rooms'.format(count))
+        print('{:>8} {:>12.2f} {:>12.2f} {:>8.1f}'.format(
+            count, legacy_time * 1000, new_time * 1000,
+            legacy_time / new_time if new_time else 0))
+        count *= 10
+
+    print('{:>8} {:>12} {:>12} {:>8}'.format('rooms', 'buckets, ms',
+                                            'trie, ms', 'x'))
+    count = 100
+    while count <= max_count:
+        numbers = sectioned_numbers(count)
+        buckets = sectioned_buckets(count)
+        bucket_time, expected = measure(
+            lambda numbers: by_buckets(numbers, buckets), numbers)
+        trie_time, actual = measure(
+            lambda numbers: by_trie(numbers, buckets), numbers)
+        if actual != expected:
+            raise AssertionError('Output differs for {} rooms'.format(count))
+        print('{:>8} {:>12.2f} {:>12.2f} {:>8.1f}'.format(
+            count, bucket_time * 1000, trie_time * 1000,
+            bucket_time / trie_time if trie_time else 0))
+        count *= 10
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""Сквозной бенчмарк кнопок на синтетических проектах.
+
+Runs Decorating, Nums grouping and Params end to end on the stand-in
+Revit API of fake_revit.py over projects built by synthetic.py.
+
+Before timing anything it checks parity: what the buttons write into the
+model must match what the original scripts in bench/legacy write into
+an identical project, for the default Decorating and for its batch and
+chunked modes, for a chunked run cancelled midway and then resumed from
+the journal of the decor cache, and for a second grouping run after
+edits. A mismatch fails the run (exit code 1). The Params edits are
+checked against the values typed into the scripted dialogs.
+
+Timings are only printed by default. They depend on the machine, so the
+baselines are recorded locally with --update (bench/baselines.json is
+not versioned) and compared with --check, which fails the run if a case
+is slower than its baseline by more than the tolerance.
+
+    python bench/scripts_bench.py [--max-rooms N] [--repeat N]
+    python bench/scripts_bench.py --update  # записать базовые значения
+    python bench/scripts_bench.py --check  # сравнить с ними
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+from timeit import default_timer as clock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+PANEL = os.path.join(ROOT, 'CPI.tab', 'АР.panel')
+sys.path.insert(0, os.path.join(ROOT, 'lib'))
+sys.path.insert(0, HERE)
+
+import fake_revit  # noqa: E402
+fake_revit.install()
+
+from cpi.params import TOLERANCE as WRITE_TOLERANCE  # noqa: E402
+from synthetic import Project  # noqa: E402
+
+BASELINES = os.path.join(HERE, 'baselines.json')
+SIZES = [100, 1000, 5000, 20000]
+TOLERANCE = 0.5  # Допустимое замедление относительно базового значения
+SCOPED_ROOMS = 20  # Выбранных помещений в частичном запуске отделки
+
+DECORATING = os.path.join(PANEL, 'Отделка помещений.pushbutton',
+                          'Decorating_script.py')
+GROUPING = os.path.join(PANEL, 'Группировка номеров.pushbutton',
+                        'Nums_grouping_script.py')
+PARAMS = os.path.join(PANEL, 'Параметры основной надписи.pushbutton',
+                      'Params_script.py')
+LEGACY_DECORATING = os.path.join(HERE, 'legacy', 'Decorating_script.py')
+LEGACY_GROUPING = os.path.join(HERE, 'legacy', 'Nums_grouping_script.py')
+
+PARITY_ROOMS = 300
+# Supposed to be [{constant of Decorating: value}], modes checked for parity
+PARITY_MODES = [{}, {'BATCH_ON': True}, {'COMMIT_CHUNK': 50}]
+PARITY_CANCEL_AT = 120  # Расчёт с записью порциями отменяется здесь
+GRID_OPTION = 'Несколько параметров (таблица)'
+
+
+def configure(source, constants):
+    """Source of a script with its module constants replaced"""
+    for name, value in constants.items():
+        source, found = re.subn(r'(?m)^{} = .*$'.format(name),
+                                '{} = {!r}'.format(name, value), source, 1)
+        if not found:
+            raise KeyError(name)
+    return source
+
+
+def run_script(path, project, constants=None, shift=False):
+    """Wall time of one run of the button script, its output is dropped"""
+    with io.open(path, encoding='utf-8') as f:
+        code = compile(configure(f.read(), constants or {}), path, 'exec')
+    scope = {
+        '__name__': '__main__',
+        '__file__': path,
+        '__revit__': project.app,
+        '__shiftclick__': shift,
+        '__forceddebugmode__': False,
+    }
+    stdout, sys.stdout = sys.stdout, io.StringIO() \
+        if sys.version_info[0] > 2 else io.BytesIO()
+    started = clock()
+    try:
+        exec(code, scope)
+    except SystemExit:
+        pass
+    finally:
+        seconds = clock() - started
+        sys.stdout = stdout
+    return seconds
+
+
+def decor_cache_path():
+    return fake_revit.get_document_data_file('cpi_decor', 'json')
+
+
+def drop_decor_cache():
+    path = decor_cache_path()
+    for path in [path, path + '.journal']:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def journal_records():
+    """Rooms checkpointed to the journal of the decor cache"""
+    path = decor_cache_path() + '.journal'
+    if not os.path.exists(path):
+        return 0
+    with io.open(path, 'rb') as f:
+        return len(f.read().splitlines())
+
+
+def select(project, elements):
+    project.app.ActiveUIDocument.Selection.SetElementIds(
+        [el.Id for el in elements])
+
+
+def decorating(project):
+    drop_decor_cache()
+    return run_script(DECORATING, project)
+
+
+def decorating_cached(project):
+    """Second run without the report (Shift), every room from the cache"""
+    drop_decor_cache()
+    run_script(DECORATING, project)
+    return run_script(DECORATING, project, shift=True)
+
+
+def decorating_recalc(project):
+    """The same with the cache off: what decorating_cached saves"""
+    drop_decor_cache()
+    run_script(DECORATING, project)
+    return run_script(DECORATING, project, {'CACHE_ON': False}, shift=True)
+
+
+def decorating_scoped(project):
+    drop_decor_cache()
+    select(project, project.rooms[:SCOPED_ROOMS])
+    return run_script(DECORATING, project)
+
+
+def grouping(project):
+    return run_script(GROUPING, project)
+
+
+def grouping_incremental(project):
+    """Second run after one room got another ceiling type"""
+    run_script(GROUPING, project)
+    room = [r for r in project.rooms if r.Area][0]
+    param = room.LookupParameter('CPI_Потолок_Тип')
+    param.Set('Другой' + param.AsString())
+    return run_script(GROUPING, project)
+
+
+def params(project):
+    """Report only: the choice of a parameter is cancelled"""
+    select(project, project.sheets)
+    return run_script(PARAMS, project)
+
+
+def params_edit(project, value='Сидоров'):
+    select(project, project.sheets)
+    fake_revit.dialogs[:] = ['Фамилия 1', value]
+    return run_script(PARAMS, project)
+
+
+def params_grid(project, edits=None):
+    """Grid editor, edits is {(row, parameter): text}"""
+    select(project, project.sheets)
+    fake_revit.dialogs[:] = [GRID_OPTION, edits or {
+        (0, 'Фамилия 2'): 'Сидоров', (1, 'Дата вручную'): '01.02.2026'}]
+    return run_script(PARAMS, project)
+
+
+CASES = [decorating, decorating_cached, decorating_recalc, decorating_scoped,
+         grouping, grouping_incremental, params, params_edit, params_grid]
+
+
+def written(project):
+    """{(room id, parameter): value} of all rooms of the project"""
+    return dict([((room.Id.IntegerValue, name), param.value)
+                 for room in project.rooms
+                 for name, param in room.params.items()])
+
+
+def differences(expected, actual):
+    """Keys whose values differ beyond the tolerance of ParamWriter"""
+    diffs = []
+    for key in sorted(set(expected) | set(actual)):
+        a, b = expected.get(key), actual.get(key)
+        if isinstance(a, float) and isinstance(b, (int, float)):
+            if abs(a - b) <= WRITE_TOLERANCE:
+                continue
+        elif a == b:
+            continue
+        diffs.append((key, a, b))
+    return diffs
+
+
+def title_blocks(project):
+    return sorted([el for el in project.doc.elements.values()
+                   if isinstance(el, fake_revit.TitleBlock)],
+                  key=lambda el: el.Id.IntegerValue)
+
+
+def edit(project):
+    """Edits between two grouping runs: another ceiling type, a renumbered
+    room, a value typed by hand into a room that is not the first of its
+    group and one into a room with zero area"""
+    rooms = [room for room in project.rooms if room.Area]
+    param = rooms[0].LookupParameter('CPI_Потолок_Тип')
+    param.Set('Другой' + param.AsString())
+    rooms[1].Number = rooms[1].Number.split('.')[0] + '.900'
+    rooms[1].LookupParameter('Номер').Set(rooms[1].Number)
+    rooms[-1].LookupParameter('CPI_Пол_Номера помещений').Set('Вручную')
+    for room in project.rooms:
+        if not room.Area:
+            room.LookupParameter('CPI_Пол_Номера помещений').Set('Вручную')
+            break
+
+
+def parity(size=PARITY_ROOMS):
+    """Failures of the parity checks, empty if everything matches"""
+    failures = []
+    reference = Project(size)
+    run_script(LEGACY_DECORATING, reference, shift=True)
+    run_script(LEGACY_GROUPING, reference)
+    expected = written(reference)
+    for constants in PARITY_MODES:
+        project = Project(size)
+        drop_decor_cache()
+        run_script(DECORATING, project, constants)
+        run_script(GROUPING, project)
+        diffs = differences(expected, written(project))
+        if diffs:
+            failures.append('Decorating {} + grouping: {} values differ, '
+                            'e.g. {}'.format(constants, len(diffs), diffs[0]))
+
+    # Отмена расчёта с записью порциями, затем запуск с журнала кэша
+    chunked = {'COMMIT_CHUNK': 50}
+    resumed = Project(size)
+    drop_decor_cache()
+    fake_revit.cancel_at['Основной расчёт'] = PARITY_CANCEL_AT
+    try:
+        run_script(DECORATING, resumed, chunked)
+    finally:
+        fake_revit.cancel_at.clear()
+    journal = journal_records()
+    if not 0 < journal < len(resumed.rooms):
+        failures.append('Decorating cancelled at room {}: {} rooms in the '
+                        'journal'.format(PARITY_CANCEL_AT, journal))
+    run_script(DECORATING, resumed, chunked)
+    run_script(GROUPING, resumed)
+    diffs = differences(expected, written(resumed))
+    if diffs:
+        failures.append('Decorating resumed after cancel: {} values differ, '
+                        'e.g. {}'.format(len(diffs), diffs[0]))
+    if journal_records():
+        failures.append('Decorating resumed after cancel: journal not removed')
+
+    # Повторная группировка после правок и ручной порчи значений
+    edit(reference)
+    run_script(LEGACY_GROUPING, reference)
+    edit(project)
+    run_script(GROUPING, project)
+    diffs = differences(written(reference), written(project))
+    if diffs:
+        failures.append('Grouping after edits: {} values differ, '
+                        'e.g. {}'.format(len(diffs), diffs[0]))
+
+    project = Project(size)
+    params_edit(project)
+    wrong = [tb.Id.IntegerValue for tb in title_blocks(project)
+             if tb.LookupParameter('Фамилия 1').value != 'Сидоров']
+    edits = {(0, 'Фамилия 2'): 'Сидоров', (2, 'Дата вручную'): '01.02.2026'}
+    project = Project(size)
+    params_grid(project, edits)
+    tbs = title_blocks(project)
+    wrong += [tbs[row].Id.IntegerValue for (row, name), text in edits.items()
+              if tbs[row].LookupParameter(name).value != text]
+    if wrong:
+        failures.append('Params: values not written to {}'.format(wrong))
+    drop_decor_cache()
+    return failures
+
+
+def measure(sizes, repeat):
+    """{case/size: seconds}, the best of the repeats on a fresh project"""
+    timings = {}
+    for size in sizes:
+        for case in CASES:
+            best = None
+            for i in range(repeat):
+                seconds = case(Project(size))
+                best = seconds if best is None else min(best, seconds)
+            key = '{}/{}'.format(case.__name__, size)
+            timings[key] = best
+            print('{:<28} {:8.3f} s'.format(key, best))
+            sys.stdout.flush()
+    drop_decor_cache()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-rooms', type=int, default=SIZES[-1])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--update', action='store_true',
+                        help='write the timings as new local baselines')
+    parser.add_argument('--check', action='store_true',
+                        help='fail if slower than the local baselines')
+    args = parser.parse_args()
+    failures = parity()
+    for failure in failures:
+        print('PARITY ' + failure)
+    if failures:
+        return 1
+    print('Parity: OK')
+    timings = measure([size for size in SIZES if size <= args.max_rooms],
+                      args.repeat)
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with io.open(BASELINES, encoding='utf-8') as f:
+            baselines = json.load(f)
+    if args.update:
+        baselines.update(timings)
+        with io.open(BASELINES, 'w', encoding='utf-8') as f:
+            f.write(u'{}\n'.format(json.dumps(baselines, indent=1,
+                                              sort_keys=True)))
+        print('Baselines updated: {}'.format(BASELINES))
+        return 0
+    if not args.check:
+        return 0
+    if not baselines:
+        print('No baselines, record them with --update first')
+        return 1
+
+    regressions = [(key, seconds, baselines[key])
+                   for key, seconds in sorted(timings.items())
+                   if key in baselines
+                   and seconds > baselines[key] * (1 + args.tolerance)]
+    for key, seconds, baseline in regressions:
+        print('REGRESSION {}: {:.3f} s, baseline {:.3f} s'.format(
+            key, seconds, baseline))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк снимков помещений: JSON против бинарного формата.
+
+Writes the same synthetic RoomData as a JSON snapshot of cpi.decor_batch
+and as a binary snapshot of cpi.snapshot, then compares the file sizes,
+the time to open each of them and the time to the calculated records.
+The records of both formats must be identical.
+
+Then the snapshot written by Decorating_script.py on a synthetic project
+(every room cached, some with zero area or CPI_Подсчёт отделки off) is
+read back and compared with the model: room parameters with their types,
+from/to rooms of the apertures and the number grouping replayed from the
+snapshot against the one of Nums_grouping_script.py.
+
+    python bench/snapshot_bench.py [max_rooms]
+"""
+
+import ast
+import io
+import os
+import random
+import sys
+import tempfile
+from timeit import default_timer as clock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'lib'))
+
+from cpi import decor_batch, snapshot  # noqa: E402
+from cpi.decor_engine import ApertureData, RoomData, SegmentData  # noqa: E402
+from cpi.grouping import GroupingPlan, NumberTrie  # noqa: E402
+
+BASES = [u'ГБ', u'КР', u'Каркас', u'ЖБ']
+SIZES = [100, 1000, 5000, 20000]
+ROUND_TRIP_ROOMS = 500
+
+
+def synthetic_rooms(count, seed=0):
+    rnd = random.Random(seed)
+    rooms = []
+    ap_id = 10 ** 6
+    for i in range(count):
+        segments = []
+        for j in range(rnd.randint(4, 8)):
+            apertures = []
+            for k in range(rnd.choice([0, 0, 1, 2])):
+                ap_id += 1
+                apertures.append(ApertureData(
+                    ap_id, rnd.uniform(2, 5), rnd.uniform(4, 8),
+                    rnd.choice([0.0, 2.6, 2.9])))
+            segments.append(SegmentData(rnd.randint(1, 10 ** 5),
+                                        rnd.uniform(1, 30),
+                                        rnd.choice(BASES), apertures))
+        rooms.append(RoomData(
+            i + 1, u'{}.{:02d}'.format(i // 100 + 1, i % 100 + 1),
+            rnd.choice([u'Кабинет', u'Коридор', u'Санузел']),
+            rnd.uniform(9, 12), rnd.choice([None, 0.0, 9.0]),
+            rnd.choice([0, 1]), rnd.choice([0.0, 0.3]), rnd.choice([0, 1]),
+            rnd.choice([0.0, 0.7, 2.0]), 3.0, rnd.choice([None, 1.5]),
+            rnd.choice([0, 1]), 4.0, 2.0, segments))
+    return rooms
+
+
+def script_constants(path, names):
+    """{name: value} of literal module constants of a button script"""
+    with io.open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read().encode('utf-8'))
+    return dict([(node.targets[0].id, ast.literal_eval(node.value))
+                 for node in tree.body if isinstance(node, ast.Assign)
+                 and getattr(node.targets[0], 'id', None) in names])
+
+
+def replay_grouping(snap, constants):
+    """{(room id, target): value} of the grouping replayed from the
+    snapshot, like Nums_grouping_script.py does it in the model"""
+    plan = GroupingPlan(constants['TABLE'], constants['EXCLUDED_NAMES'])
+    ids = list(snap['room.id'])
+    counted = [i for i in range(snap.rooms) if snap.area(i) > 0]
+    trie = NumberTrie([snap.number(i) for i in counted])
+    rows = plan.read(counted, snap.look)
+    values = {}
+    for target, rooms_by_kind in zip(plan.targets, plan.buckets(rows)):
+        for kind, indexes in rooms_by_kind.items():
+            value = trie.group(indexes, constants['SIMPLE_MODE'])
+            for n in indexes:
+                values[ids[counted[n]], target] = value
+        for i in range(snap.rooms):
+            if not snap.area(i) > 0:
+                values[ids[i], target] = 'Не определено'
+    return values
+
+
+def round_trip(count=ROUND_TRIP_ROOMS):
+    """Check the snapshot of Decorating_script.py against the model"""
+    import scripts_bench
+    from scripts_bench import fake_revit
+    project = scripts_bench.Project(count)
+    for room in project.rooms[::50]:
+        room.LookupParameter('CPI_Подсчёт отделки').Set(0)
+    scripts_bench.drop_decor_cache()
+    scripts_bench.run_script(scripts_bench.GROUPING, project)
+    scripts_bench.run_script(scripts_bench.DECORATING, project)
+    # Все помещения уже в кэше: снимок не зависит от пересчёта
+    scripts_bench.run_script(scripts_bench.DECORATING, project,
+                             {'SNAPSHOT_ON': True})
+    path = fake_revit.get_document_data_file('cpi_snapshot', 'bin')
+    failures = []
+    with snapshot.Snapshot(path) as snap:
+        rooms = project.doc.elements
+        ids = list(snap['room.id'])
+        if sorted(ids) != sorted([r.Id.IntegerValue for r in project.rooms]):
+            failures.append('rooms differ')
+        for i, room_id in enumerate(ids):
+            room = rooms[room_id]
+            for name, param in room.params.items():
+                if not (name.startswith('CPI_') or name in ('Номер', 'Имя')):
+                    continue
+                if snap.look(i, name) != param.value:
+                    failures.append('{} of room {}: {!r} instead of {!r}'
+                                    .format(name, room_id,
+                                            snap.look(i, name), param.value))
+            if snap.area(i) != room.Area:
+                failures.append('area of room {}'.format(room_id))
+        phase = project.phase
+        for k, ap_id in enumerate(snap['table.ap_id']):
+            ap = rooms[ap_id]
+            expected = tuple([side[phase].Id.IntegerValue if side[phase]
+                              else None for side in (ap.FromRoom, ap.ToRoom)])
+            if snap.sides(k) != expected:
+                failures.append('sides of aperture {}: {} instead of {}'
+                                .format(ap_id, snap.sides(k), expected))
+        constants = script_constants(scripts_bench.GROUPING, [
+            'TABLE', 'EXCLUDED_NAMES', 'SIMPLE_MODE'])
+        for (room_id, target), value in replay_grouping(
+                snap, constants).items():
+            if rooms[room_id].LookupParameter(target).value != value:
+                failures.append('{} of room {} replayed as {!r}'.format(
+                    target, room_id, value))
+        enabled = len([i for i in range(snap.rooms) if snap.enabled(i)])
+    os.remove(path)
+    scripts_bench.drop_decor_cache()
+    if failures:
+        raise AssertionError('Snapshot differs from the model: {} ({} more)'
+                             .format(failures[0], len(failures) - 1))
+    print('Snapshot of {} rooms ({} calculated) matches the model'.format(
+        len(ids), enabled))
+
+
+def main(max_rooms=20000):
+    folder = tempfile.gettempdir()
+    json_path = os.path.join(folder, 'cpi_bench.cpi_snapshot.json')
+    bin_path = os.path.join(folder, 'cpi_bench' + snapshot.SUFFIX)
+    print('{:>8} {:>10} {:>10} {:>12} {:>12} {:>12} {:>12}'.format(
+        'rooms', 'json, KB', 'bin, KB', 'json open', 'bin open',
+        'json calc', 'bin calc'))
+    for count in [size for size in SIZES if size <= max_rooms]:
+        rooms = synthetic_rooms(count)
+        decor_batch.save_snapshot(json_path, rooms, 1.6)
+        snapshot.save(bin_path, rooms, 1.6)
+
+        started = clock()
+        loaded, guard_threshold = decor_batch.load_snapshot(json_path)
+        json_open = clock() - started
+        expected = decor_batch.compute_records(loaded, guard_threshold)
+        json_calc = clock() - started
+
+        started = clock()
+        with snapshot.Snapshot(bin_path) as snap:
+            bin_open = clock() - started
+            actual = snap.table().records(snap.guard_threshold)
+            bin_calc = clock() - started
+        if actual != expected:
+            raise AssertionError('Records differ for {} rooms'.format(count))
+        print('{:>8} {:>10} {:>10} {:>10.2f}ms {:>10.2f}ms {:>10.2f}ms '
+              '{:>10.2f}ms'.format(
+                  count, os.path.getsize(json_path) // 1024,
+                  os.path.getsize(bin_path) // 1024, json_open * 1000,
+                  bin_open * 1000, json_calc * 1000, bin_calc * 1000))
+    for path in (json_path, bin_path):
+        os.remove(path)
+    round_trip()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
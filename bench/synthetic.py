@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Генератор синтетических проектов для бенчмарков.
+
+Rooms are laid out on a grid: neighbouring rooms share walls, every room
+has a door to its left neighbour (or to the corridor) and a window in
+its upper wall. Parameters, wall types, door and window types with
+occasional instance overrides, zero-area rooms, sheets and title blocks
+are filled in deterministically from the seed."""
+
+import math
+import random
+
+from fake_revit import (BoundarySegment, Document, Element, FamilyInstance,
+                        Room, Sheet, TitleBlock, UIApplication, Wall)
+
+FEET_PER_M = 1000 / 304.8
+
+DECOR_BASES = ['ГБ', 'КР', 'Каркас', 'ЖБ']
+FLOORS = ['Пол-1', 'Пол-2', 'Пол-3', 'Керамогранит']
+CEILINGS = ['Армстронг', 'ГКЛ', 'Без отделки']
+FINISHES = ['Покраска', 'Обои', 'Плитка']
+BASEBOARDS = ['h=80 мм', 'h=100 мм', None]
+GUARDS = ['Отбойник ПВХ', None]
+APRONS = ['Фартук плитка', None]
+NAMES = ['Кабинет', 'Коридор', 'Санузел', 'Кладовая', 'Лестничная клетка']
+TITLE_PARAMS = ['Фамилия 1', 'Фамилия 2', 'Фамилия 3', 'Фамилия 4',
+                'Подпись 1', 'Подпись 2', 'Дата вручную', 'Имя листа',
+                'Время печати', 'Выносные линии']
+OTHER_PARAMS = ['Масштаб', 'Стадия проекта', 'Шифр', 'Организация',
+                'Комментарии', 'Марка']
+
+
+class Project(object):
+    """Synthetic model: project.app is passed to scripts as __revit__"""
+
+    def __init__(self, rooms, seed=1):
+        self.rnd = random.Random(seed)
+        self.doc = Document()
+        self.app = UIApplication(self.doc)
+        self.phase = Element(self.doc, 'OST_Phases')
+        self.wall_types = [Element(self.doc, None, {
+            'CPI_Основа черновой отделки': base}) for base in DECOR_BASES]
+        self.door_types = [self.symbol(0.9 + 0.1 * i, 2.1) for i in range(4)]
+        self.window_types = [self.symbol(1.2 + 0.3 * i, 1.5)
+                             for i in range(4)]
+        self.rooms = []
+        self.sheets = []
+        self.build_rooms(rooms)
+        self.build_sheets(max(10, rooms // 20))
+
+    def symbol(self, width, height):
+        params = {}
+        if self.rnd.random() < 0.5:
+            params['Ширина'] = width * FEET_PER_M
+            params['Высота'] = height * FEET_PER_M
+        else:
+            params['Примерная ширина'] = width * FEET_PER_M
+            params['Примерная высота'] = height * FEET_PER_M
+        return Element(self.doc, None, params)
+
+    def wall(self):
+        return Wall(self.doc, self.rnd.choice(self.wall_types).Id)
+
+    def room(self, index, width, depth):
+        rnd = self.rnd
+        floor, place = divmod(index, 100)
+        number = '{}.{:02d}'.format(floor + 1, place + 1)
+        area = 0.0 if rnd.random() < 0.01 else width * depth
+        params = {
+            'Имя': rnd.choice(NAMES),
+            'Стадия': self.phase.Id,
+            'Полная высота': rnd.choice([3.0, 3.3, 3.6]) * FEET_PER_M,
+            'Периметр': 2 * (width + depth),
+            'CPI_Потолок_Высота': rnd.choice([0.0, 2.7, 3.0]) * FEET_PER_M,
+            'CPI_Подсчёт отделки': 1,
+            'CPI_Плинтус_Описание': rnd.choice(BASEBOARDS),
+            'CPI_Отбойник_Наличие': rnd.choice([0, 1]),
+            'CPI_Отбойник_Ширина': rnd.choice([0.0, 0.2, 0.6]) * FEET_PER_M,
+            'CPI_Отбойник_Отметка верха': 0.9 * FEET_PER_M,
+            'CPI_Отбойник_Запас': rnd.choice([0.0, 0.5]) * FEET_PER_M,
+            'CPI_Отбойник_Описание': rnd.choice(GUARDS),
+            'CPI_Фартук_Наличие': rnd.choice([0, 1]),
+            'CPI_Фартук_Ширина': 1.2 * FEET_PER_M,
+            'CPI_Фартук_Высота': 0.6 * FEET_PER_M,
+            'CPI_Фартук_Описание': rnd.choice(APRONS),
+            'CPI_Потолок_Тип': rnd.choice(CEILINGS),
+            'CPI_Чистовая_Тип отделки': rnd.choice(FINISHES),
+            'CPI_Пол_Тип конструкции': rnd.choice(FLOORS),
+            'CPI_Пол2_Тип конструкции': rnd.choice(FLOORS),
+            'CPI_Чистовая_Площадь отделки': 0.0,
+            'CPI_Плинтус_Длина': 0.0,
+            'CPI_Отбойник_Длина': 0.0,
+        }
+        for base in DECOR_BASES:
+            params['CPI_Черновая-{}_Тип'.format(base)] = \
+                rnd.choice(['{}-1'.format(base), '{}-2'.format(base)])
+            params['CPI_Черновая-{}_Площадь'.format(base)] = 0.0
+        room = Room(self.doc, number, area, params)
+        # Пустые галочки заполняет предварительный проход Decorating
+        room.add('CPI_Плинтус_Наличие', rnd.choice([0, 1, None]), 'Integer')
+        for target in ['Отбойник', 'Потолок', 'Чистовая', 'Пол2', 'Пол',
+                       'Фартук', 'Потолок и стены', 'Черновая']:
+            room.add('CPI_{}_Номера помещений'.format(target), None, 'String')
+        return room
+
+    def opening(self, category, types, host, from_room, to_room, sill):
+        params = {}
+        if self.rnd.random() < 0.1:  # Размер экземпляра вместо типоразмера
+            params['Ширина'] = self.rnd.choice([0.8, 1.0]) * FEET_PER_M
+        FamilyInstance(self.doc, category, self.rnd.choice(types), host,
+                       from_room, to_room, sill * FEET_PER_M, params)
+
+    def build_rooms(self, count):
+        rnd = self.rnd
+        cols = int(math.ceil(math.sqrt(count)))
+        rows = int(math.ceil(float(count) / cols))
+        widths = [rnd.uniform(3, 6) * FEET_PER_M for c in range(cols)]
+        depths = [rnd.uniform(3, 6) * FEET_PER_M for r in range(rows)]
+        across = [[self.wall() for c in range(cols)] for r in range(rows + 1)]
+        along = [[self.wall() for c in range(cols + 1)] for r in range(rows)]
+        grid = {}
+        for index in range(count):
+            r, c = divmod(index, cols)
+            room = grid[r, c] = self.room(index, widths[c], depths[r])
+            self.rooms.append(room)
+            if not room.Area:
+                continue
+            room.loops = [[
+                BoundarySegment(across[r][c].Id, widths[c]),
+                BoundarySegment(along[r][c + 1].Id, depths[r]),
+                BoundarySegment(across[r + 1][c].Id, widths[c]),
+                BoundarySegment(along[r][c].Id, depths[r]),
+            ]]
+            self.opening('OST_Doors', self.door_types, along[r][c],
+                         grid.get((r, c - 1)), room, 0.0)
+            self.opening('OST_Windows', self.window_types, across[r][c],
+                         None, room, rnd.choice([0.0, 0.8, 0.9]))
+
+    def build_sheets(self, count):
+        title_type = Element(self.doc, None)
+        for i in range(count):
+            sheet = Sheet(self.doc, 'А-{}'.format(i + 1))
+            params = dict([(name, self.rnd.choice(['Иванов', 'Петров', None]))
+                           for name in TITLE_PARAMS])
+            params.update([(name, 'значение') for name in OTHER_PARAMS])
+            params['Количество измов для листа'] = self.rnd.choice([0, 1, 2])
+            TitleBlock(self.doc, sheet, title_type.Id, params)
+            self.sheets.append(sheet)
+
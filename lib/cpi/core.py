@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Общие константы и функции кнопок CPI.
+
+pyRevit keeps imported lib modules alive between clicks of the same
+session, so everything compiled here (regular expressions, natural sort
+keys) is built once and reused by the following runs."""
+
+import os
+import re
+import sys
+
+FEET_TO_MM = 304.8
+FEET_TO_M = 304.8 / 1000
+MM_TO_FEET = 1 / FEET_TO_MM
+M_TO_FEET = 1 / FEET_TO_M
+F2_TO_M2 = FEET_TO_MM**2 / 10**6
+
+
+class Lazy(object):
+    """Proxy creating the wrapped object on the first attribute access.
+    Lets scripts skip heavy imports (forms, output window) on the paths
+    where they are not needed."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+
+    def __getattr__(self, name):
+        if self._obj is None:
+            self._obj = self._factory()
+        return getattr(self._obj, name)
+
+
+def lazy_import(name):
+    def load():
+        __import__(name)
+        return sys.modules[name]
+    return Lazy(load)
+
+
+def get_collector(doc, cat_name):
+    from Autodesk.Revit.DB import BuiltInCategory as bic
+    import Autodesk.Revit.DB as db
+    return list(db.FilteredElementCollector(doc)
+                  .OfCategory(getattr(bic, cat_name))
+                  .WhereElementIsNotElementType()
+                  .ToElements())
+
+
+def count_elements(doc, cat_name):
+    """Number of elements of the category without wrapping them"""
+    from Autodesk.Revit.DB import BuiltInCategory as bic
+    import Autodesk.Revit.DB as db
+    return db.FilteredElementCollector(doc) \
+        .OfCategory(getattr(bic, cat_name)) \
+        .WhereElementIsNotElementType() \
+        .GetElementCount()
+
+
+def sidecar_path(doc, suffix):
+    """Path of a file next to the model or None for unsaved/cloud models."""
+    path = doc.PathName
+    if path and os.path.isdir(os.path.dirname(path)):
+        return os.path.splitext(path)[0] + suffix
+    return None
+
+
+DIGITS = re.compile('([0-9]+)')
+KEYS_LIMIT = 100000
+_keys = {}  # Supposed to be {text: natural sort key}, shared between clicks
+
+
+def natural_key(text):
+    if text not in _keys:
+        if len(_keys) > KEYS_LIMIT:
+            _keys.clear()
+        _keys[text] = [int(c) if c.isdigit() else c
+                       for c in DIGITS.split(text)]
+    return _keys[text]
+
+
+def natural_sorted(list, key=lambda s: s):
+    """
+    Sort the list into natural alphanumeric order.
+    """
+    return sorted(list, key=lambda s: natural_key(key(s)))
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Пакетный расчёт отделки по снимкам помещений.
+
+Rooms are extracted once into plain RoomData on the Revit API thread and
+calculated by the columnar cpi.decor_columns in worker threads: IronPython
+has no GIL, so threads run in parallel inside Revit. Results always come back in the
+order of the input, so the following commit does not depend on timing.
+
+Snapshots saved by Decorating_script.py (binary *.cpi_snapshot.bin of
+cpi.snapshot or the former *.cpi_snapshot.json) can be recalculated on
+a build machine, one process per file:
+
+    cd lib
+    python -m cpi.decor_batch -j 8 project1.cpi_snapshot.bin ...
+"""
+
+import io
+import json
+import os
+import threading
+from timeit import default_timer as clock
+
+from cpi import snapshot
+from cpi.decor_columns import SegmentTable
+from cpi.decor_engine import ApertureData, RoomData, SegmentData
+
+SNAPSHOT_VERSION = 1
+RESULTS_SUFFIX = '.results.json'
+
+
+def parallel(calculate_chunk, rooms, workers=1):
+    """calculate_chunk(rooms) -> [item] over contiguous chunks of rooms,
+    one per worker thread. Items come in the order of rooms."""
+    if workers <= 1 or len(rooms) < 2:
+        return calculate_chunk(rooms)
+    size = (len(rooms) + workers - 1) // workers
+    starts = range(0, len(rooms), size)
+    chunks = [None] * len(starts)
+    failures = []
+
+    def work(n):
+        try:
+            chunks[n] = calculate_chunk(rooms[starts[n]:starts[n] + size])
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=work, args=(n,))
+               for n in range(len(starts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0]
+    return [item for chunk in chunks for item in chunk]
+
+
+def compute_records(rooms, guard_threshold, workers=1):
+    """Cache records of the RoomData in the order of rooms, calculated
+    over columnar SegmentTable chunks."""
+    return parallel(lambda chunk: SegmentTable(chunk).records(guard_threshold),
+                    rooms, workers)
+
+
+def save_snapshot(path, rooms, guard_threshold):
+    """Write the RoomData as JSON, False if the file is not writable."""
+    # namedtuples are written as plain lists in the order of their fields
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'guard_threshold': guard_threshold,
+        'rooms': rooms,
+    }
+    try:
+        with io.open(path, 'wb') as f:
+            f.write(json.dumps(snapshot).encode('utf-8'))
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def load_snapshot(path):
+    """(rooms, guard_threshold) of the snapshot file"""
+    with io.open(path, 'rb') as f:
+        snapshot = json.loads(f.read().decode('utf-8'))
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError('Unsupported snapshot version: {}'.format(path))
+    rooms = [RoomData(*(row[:-1] + [[
+        SegmentData(*(seg[:-1] + [[ApertureData(*ap) for ap in seg[-1]]]))
+        for seg in row[-1]]]))
+        for row in snapshot['rooms']]
+    return rooms, snapshot['guard_threshold']
+
+
+def process_file(path):
+    """Calculate the snapshot and write [room_id, record] pairs next to it.
+    Rooms with zero area or CPI_Подсчёт отделки off are left out.
+    Returns (path, number of rooms, seconds)."""
+    started = clock()
+    if snapshot.is_snapshot(path):
+        with snapshot.Snapshot(path) as snap:
+            records = [[room_id, record] for i, (room_id, record)
+                       in enumerate(zip(list(snap['room.id']), snap.table()
+                                        .records(snap.guard_threshold)))
+                       if snap.enabled(i)]
+    else:
+        rooms, guard_threshold = load_snapshot(path)
+        records = [[room.id, record] for room, record
+                   in zip(rooms, compute_records(rooms, guard_threshold))]
+    with io.open(os.path.splitext(path)[0] + RESULTS_SUFFIX, 'wb') as f:
+        f.write(json.dumps({'version': SNAPSHOT_VERSION, 'rooms': records})
+                .encode('utf-8'))
+    return path, len(records), clock() - started
+
+
+def run_files(paths, workers=None):
+    """process_file() for many snapshots, one process per file where
+    the interpreter supports it. Results come in the order of paths."""
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+    except ImportError:  # IronPython, Python 2
+        return [process_file(path) for path in paths]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(process_file, paths))
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Recalculate finishing quantities of room snapshots')
+    parser.add_argument('paths', nargs='+',
+                        help='*.cpi_snapshot.bin or *.cpi_snapshot.json')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of processes (default: CPU count)')
+    args = parser.parse_args()
+    for path, rooms, seconds in run_files(args.paths, args.jobs):
+        print('{}: {} rooms, {:.3f} s'.format(path, rooms, seconds))
+
+
+if __name__ == '__main__':
+    main()
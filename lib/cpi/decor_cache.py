@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Постоянный кэш результатов расчёта отделки"""
+
+import hashlib
+import io
+import json
+import os
+
+VERSION = 1
+
+
+def fingerprint(values):
+    """Stable hash of the calculation inputs.
+    Floats are rounded, so that noise of the geometry engine does not
+    invalidate the cache."""
+    parts = [repr(round(value, 9)) if isinstance(value, float)
+             else u'{}'.format(value) for value in values]
+    return hashlib.md5(u'\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+class DecorCache(object):
+    """Room results keyed by the fingerprint of their inputs.
+    Stored as JSON, loaded at start and saved after a successful commit.
+    A disabled cache misses every lookup but still keeps the stored
+    results of the rooms that were not recalculated.
+    checkpoint() appends the rooms put since the previous checkpoint to a
+    journal next to the cache; the journal is replayed by load() and
+    removed by save(), so a run interrupted between partial commits
+    resumes from its last checkpoint. A run that put nothing does not
+    rewrite the file."""
+
+    def __init__(self, path, enabled=True):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.enabled = enabled
+        self.rooms = {}  # Supposed to be {room_id: [fingerprint, record]}
+        self.unsaved = []  # Ids of the rooms put since the last checkpoint
+        self.changed = False  # Были ли изменения после загрузки
+        self.checkpoints = 0
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with io.open(self.path, 'rb') as f:
+                    data = json.loads(f.read().decode('utf-8'))
+            except ValueError:  # Повреждённый файл кэша просто игнорируется
+                data = {}
+            if data.get('version') == VERSION:
+                self.rooms = data['rooms']
+        if os.path.exists(self.journal_path):
+            with io.open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        version, room_id, key, record = \
+                            json.loads(line.decode('utf-8'))
+                    except ValueError:  # Оборванная последняя строка
+                        break
+                    if version == VERSION:
+                        self.rooms[room_id] = [key, record]
+                        self.changed = True
+
+    def get(self, room_id, key, restore=lambda record: record):
+        """Result restored from the stored record or None if the fingerprint
+        differs or restore() rejects the record."""
+        entry = self.rooms.get(str(room_id)) if self.enabled else None
+        result = restore(entry[1]) if entry and entry[0] == key else None
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, room_id, key, record):
+        if self.rooms.get(str(room_id)) != [key, record]:
+            self.changed = True
+        self.rooms[str(room_id)] = [key, record]
+        self.unsaved.append(str(room_id))
+
+    def checkpoint(self):
+        """Append the rooms put since the previous checkpoint to the
+        journal, False if the folder is not writable."""
+        try:
+            with io.open(self.journal_path, 'ab') as f:
+                for room_id in self.unsaved:
+                    f.write(json.dumps([VERSION, room_id] + self.rooms[room_id])
+                            .encode('utf-8') + b'\n')
+        except (IOError, OSError):
+            return False
+        self.unsaved = []
+        self.checkpoints += 1
+        return True
+
+    def save(self):
+        """Write the cache if anything changed, False if the folder is not
+        writable."""
+        if not self.changed:
+            return True
+        temp_path = self.path + '.tmp'
+        try:
+            with io.open(temp_path, 'wb') as f:
+                f.write(json.dumps({'version': VERSION, 'rooms': self.rooms})
+                        .encode('utf-8'))
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(temp_path, self.path)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+        except (IOError, OSError):
+            return False
+        self.unsaved = []
+        self.changed = False
+        return True
+
+    def stats(self):
+        return 'Помещений из кэша: {}, пересчитано: {}' \
+            .format(self.hits, self.misses)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Колоночное представление участков стен и проёмов для расчёта отделки.
+
+Segments and apertures of many rooms are kept in flat typed arrays
+instead of lists of namedtuples; decor bases are coded by small ints.
+The quantities are computed column by column over these arrays, in the
+same order of additions as cpi.decor_engine.calculate, so the results
+are identical to the last bit."""
+
+from array import array
+from operator import mul, sub
+
+from cpi.decor_engine import CEILING_RESERVE, Aperture, Result, Segment
+
+
+class SegmentTable(object):
+    """Boundary segments and apertures of the RoomData in flat arrays.
+    Segments of room i are seg_start[i]:seg_start[i + 1], apertures of
+    segment j are ap_start[j]:ap_start[j + 1]."""
+
+    def __init__(self, rooms):
+        self.rooms = rooms
+        self.bases = []  # Decor bases by code
+        codes = {}  # Supposed to be {decor_base: code}
+        self.seg_start = array('l', [0])
+        self.length = array('d')
+        self.base = array('l')
+        self.host_id = []  # Ids may not fit into a C long
+        self.ap_start = array('l', [0])
+        self.ap_id = []
+        self.width = array('d')
+        self.height = array('d')
+        self.sill_height = array('d')
+        for room in rooms:
+            for seg in room.segments:
+                if seg.decor_base not in codes:
+                    codes[seg.decor_base] = len(self.bases)
+                    self.bases.append(seg.decor_base)
+                self.length.append(seg.length)
+                self.base.append(codes[seg.decor_base])
+                self.host_id.append(seg.host_id)
+                for ap in seg.apertures:
+                    self.ap_id.append(ap.id)
+                    self.width.append(ap.width)
+                    self.height.append(ap.height)
+                    self.sill_height.append(ap.sill_height)
+                self.ap_start.append(len(self.width))
+            self.seg_start.append(len(self.length))
+
+    @classmethod
+    def from_columns(cls, rooms, bases, columns):
+        """Table over ready columns, e.g. memoryviews of a binary snapshot;
+        columns is {attribute: sequence} of the same layout as above."""
+        self = cls.__new__(cls)
+        self.rooms = rooms
+        self.bases = bases
+        for name, column in columns.items():
+            setattr(self, name, column)
+        return self
+
+    def aperture_areas(self):
+        """Areas of apertures and their sums by segment"""
+        areas = array('d', map(float.__mul__, self.width, self.height))
+        starts = self.ap_start
+        by_segment = array('d', [sum(areas[starts[j]:starts[j + 1]])
+                                 for j in range(len(self.length))])
+        return areas, by_segment
+
+    def deducted(self, i, on, height, total=0):
+        """Boundary length of room i minus widths of the apertures below
+        the height (baseboard or guard), in the order of the engine."""
+        if not on:
+            return total
+        starts, width, sill_height = self.ap_start, self.width, self.sill_height
+        for j in range(self.seg_start[i], self.seg_start[i + 1]):
+            total += self.length[j]
+            for k in range(starts[j], starts[j + 1]):
+                if height > sill_height[k]:
+                    total -= width[k]
+        return total
+
+    def totals(self, guard_threshold):
+        """Quantities of every segment and room computed column by column:
+        (apertures areas, prepared areas of segments, decor bases of
+        segments, [(final_decor_heigth, prep_decor_area, final_decor_area,
+        baseboard_lenth, guard_lenth, apron_area)] by room)"""
+        areas, apertures_area = self.aperture_areas()
+        heigths = []  # Supposed to be [(full, final decor)] by room
+        full_heigth = array('d')  # Of the room by segment
+        final_decor_heigth = array('d')  # Of the room by segment
+        for i, room in enumerate(self.rooms):
+            ceiling_heigth = room.ceiling_heigth or room.full_heigth
+            heigths.append(min(ceiling_heigth + CEILING_RESERVE,
+                               room.full_heigth))
+            count = self.seg_start[i + 1] - self.seg_start[i]
+            full_heigth.extend([room.full_heigth] * count)
+            final_decor_heigth.extend([heigths[-1]] * count)
+        seg_prep = list(map(sub, map(mul, self.length, full_heigth),
+                            apertures_area))
+        seg_final = list(map(sub, map(mul, self.length, final_decor_heigth),
+                             apertures_area))
+        bases = [self.bases[code] for code in self.base]
+        rooms = []
+        for i, room in enumerate(self.rooms):
+            first, last = self.seg_start[i], self.seg_start[i + 1]
+            prep_decor_area = {}  # Supposed to be {decor_base: Area}
+            for base, area in zip(bases[first:last], seg_prep[first:last]):
+                prep_decor_area[base] = prep_decor_area.get(base, 0) + area
+            final_decor_area = sum(seg_final[first:last])
+            guard_lenth = self.deducted(i, room.guard_on, room.guard_height,
+                                        0 + (room.guard_reserve or 0))
+            apron_area = room.apron_width * room.apron_height \
+                if room.apron_on else 0
+            if room.guard_width >= guard_threshold:
+                final_decor_area -= room.guard_width * guard_lenth
+            final_decor_area -= apron_area
+            rooms.append((heigths[i], prep_decor_area, final_decor_area,
+                          self.deducted(i, room.baseboard_on,
+                                        room.baseboard_height),
+                          guard_lenth, apron_area))
+        return areas, seg_prep, bases, rooms
+
+    def results(self, guard_threshold):
+        """Engine Results of all rooms, the same as decor_engine.calculate"""
+        areas, seg_prep, bases, rooms = self.totals(guard_threshold)
+        apertures = list(map(Aperture, self.ap_id, areas))
+        starts = self.ap_start
+        segments = list(map(Segment, self.length, bases,
+                            [apertures[starts[j]:starts[j + 1]]
+                             for j in range(len(self.length))],
+                            self.host_id, seg_prep))
+        return [Result(final_decor_heigth, segments[first:last],
+                       prep_decor_area, final_decor_area, baseboard_lenth,
+                       guard_lenth, apron_area)
+                for first, last, (final_decor_heigth, prep_decor_area,
+                                  final_decor_area, baseboard_lenth,
+                                  guard_lenth, apron_area)
+                in zip(self.seg_start, self.seg_start[1:], rooms)]
+
+    def records(self, guard_threshold):
+        """Cache records of all rooms, the same as Room.to_record() of
+        Decorating_script.py gives, without building the namedtuples."""
+        areas, seg_prep, bases, rooms = self.totals(guard_threshold)
+        apertures = [[ap_id, area] for ap_id, area in zip(self.ap_id, areas)]
+        starts = self.ap_start
+        segments = [[self.length[j], bases[j], self.host_id[j], seg_prep[j],
+                     apertures[starts[j]:starts[j + 1]]]
+                    for j in range(len(self.length))]
+        records = []
+        for i, room in enumerate(self.rooms):
+            (final_decor_heigth, prep_decor_area, final_decor_area,
+             baseboard_lenth, guard_lenth, apron_area) = rooms[i]
+            records.append({
+                'number': room.number,
+                'name': room.name,
+                'full_heigth': room.full_heigth,
+                'final_decor_heigth': final_decor_heigth,
+                'prep_decor_area': prep_decor_area,
+                'final_decor_area': final_decor_area,
+                'baseboard_lenth': baseboard_lenth,
+                'baseboard_height': room.baseboard_height,
+                'guard_width': room.guard_width,
+                'guard_height': room.guard_height,
+                'guard_reserve': room.guard_reserve or 0,
+                'guard_lenth': guard_lenth,
+                'apron_width': room.apron_width,
+                'apron_height': room.apron_height,
+                'apron_area': apron_area,
+                'segments': segments[self.seg_start[i]:self.seg_start[i + 1]],
+            })
+        return records
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Расчёт отделки помещений без Revit API.
+
+The engine takes plain records extracted from the model, so it can be
+profiled and run outside of Revit and of the UI thread. Room in
+Decorating_script.py takes its numbers from calculate(); the columnar
+cpi.decor_columns repeats it for batches and is checked against it with
+PARITY_ON of the script. bench/scripts_bench.py checks both modes against
+the original script in bench/legacy."""
+
+from collections import namedtuple
+
+from cpi.core import MM_TO_FEET
+
+RoomData = namedtuple('RoomData', [
+    'id',
+    'number',
+    'name',
+    'full_heigth',
+    'ceiling_heigth',
+    'baseboard_on',
+    'baseboard_height',
+    'guard_on',
+    'guard_width',
+    'guard_height',
+    'guard_reserve',
+    'apron_on',
+    'apron_width',
+    'apron_height',
+    'segments',  # Supposed to be [SegmentData] of valid boundary segments
+])
+
+SegmentData = namedtuple('SegmentData', [
+    'host_id',
+    'length',
+    'decor_base',
+    'apertures',  # Supposed to be [ApertureData] assigned to the segment
+])
+
+ApertureData = namedtuple('ApertureData', [
+    'id',
+    'width',
+    'height',
+    'sill_height',
+])
+
+Segment = namedtuple('Segment', [
+    'length',
+    'decor_base',
+    'apertures',
+    'host_id',
+    'seg_prep_decor_area',
+])
+
+Aperture = namedtuple('Aperture', ['Id', 'area'])
+
+Result = namedtuple('Result', [
+    'final_decor_heigth',
+    'segments',
+    'prep_decor_area',
+    'final_decor_area',
+    'baseboard_lenth',
+    'guard_lenth',
+    'apron_area',
+])
+
+CEILING_RESERVE = 100 * MM_TO_FEET  # Заход чистовой отделки за потолок
+
+
+def parse_baseboard_height(description):
+    """Baseboard height in mm from its description, e.g. 'h=80 мм'."""
+    if not description:
+        return 0
+    description = description.replace('мм', '').replace('=', '') \
+        .replace(',', '').replace('.', '')
+    digits = [int(s) for s in description.split() if s.isdigit()]
+    return digits[0] if digits else 0
+
+
+def calculate(room, guard_threshold):
+    """Finishing quantities of the RoomData, all values in Revit units."""
+    ceiling_heigth = room.ceiling_heigth or room.full_heigth
+    final_decor_heigth = min(ceiling_heigth + CEILING_RESERVE,
+                             room.full_heigth)
+    segments = []
+    prep_decor_area = {}  # Supposed to be {decor_base: Area}
+    final_decor_area = 0
+    baseboard_lenth = 0
+    guard_reserve = room.guard_reserve or 0
+    guard_lenth = 0 + guard_reserve
+    apron_area = room.apron_width * room.apron_height if room.apron_on else 0
+    for seg in room.segments:
+        length = seg.length
+        if seg.decor_base not in prep_decor_area:
+            prep_decor_area[seg.decor_base] = 0
+        baseboard_lenth += length if room.baseboard_on else 0
+        guard_lenth += length if room.guard_on else 0
+        for ap in seg.apertures:
+            if room.baseboard_on:
+                if room.baseboard_height > ap.sill_height:
+                    baseboard_lenth -= ap.width
+            if room.guard_on:
+                if room.guard_height > ap.sill_height:
+                    guard_lenth -= ap.width
+        apertures = [Aperture(ap.id, ap.width * ap.height)
+                     for ap in seg.apertures]
+        apertures_area = sum([ap.area for ap in apertures])
+        seg_prep_decor_area = length * room.full_heigth - apertures_area
+        prep_decor_area[seg.decor_base] += seg_prep_decor_area
+        final_decor_area += length * final_decor_heigth - apertures_area
+        segments.append(Segment(
+            length=length,
+            decor_base=seg.decor_base,
+            apertures=apertures,
+            host_id=seg.host_id,
+            seg_prep_decor_area=seg_prep_decor_area,
+        ))
+    if room.guard_width >= guard_threshold:
+        final_decor_area -= room.guard_width * guard_lenth
+    final_decor_area -= apron_area
+    return Result(
+        final_decor_heigth=final_decor_heigth,
+        segments=segments,
+        prep_decor_area=prep_decor_area,
+        final_decor_area=final_decor_area,
+        baseboard_lenth=baseboard_lenth,
+        guard_lenth=guard_lenth,
+        apron_area=apron_area,
+    )
+
+
+def _id(value):
+    return getattr(value, 'IntegerValue', value)
+
+
+def compare(room, result):
+    """Parity check of a calculated Room (or any object with the same
+    fields) against the engine Result. Returns the list of mismatches,
+    numbers must be identical, not just close."""
+    mismatches = []
+    for field in ['final_decor_heigth', 'prep_decor_area', 'final_decor_area',
+                  'baseboard_lenth', 'guard_lenth', 'apron_area']:
+        if getattr(room, field) != getattr(result, field):
+            mismatches.append('{}: {} != {}'.format(
+                field, getattr(room, field), getattr(result, field)))
+    if len(room.segments) != len(result.segments):
+        mismatches.append('segments: {} != {}'.format(
+            len(room.segments), len(result.segments)))
+        return mismatches
+    for i, (seg, expected) in enumerate(zip(room.segments, result.segments)):
+        actual = (seg.length, seg.decor_base, _id(seg.host_id),
+                  seg.seg_prep_decor_area,
+                  [(_id(ap.Id), ap.area) for ap in seg.apertures])
+        expected = (expected.length, expected.decor_base, expected.host_id,
+                    expected.seg_prep_decor_area,
+                    [(ap.Id, ap.area) for ap in expected.apertures])
+        if actual != expected:
+            mismatches.append('segment {}: {} != {}'.format(
+                i + 1, actual, expected))
+    return mismatches
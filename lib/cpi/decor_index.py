@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Индексы элементов для расчёта отделки помещений"""
+
+from cpi.decor_engine import ApertureData
+from cpi.params import Lookuper, lookup
+from cpi.probe import count
+
+SEPARATOR = '<Разделитель помещений>'
+CURTAIN_FAMILY = 'Витраж'
+NO_DECOR_BASE = '???'
+
+
+def is_valid(instance):
+    if not instance:
+        return False
+    if instance.Category.Name == SEPARATOR:
+        return False
+    if lookup(instance, 'Семейство').AsValueString() == CURTAIN_FAMILY:
+        return False
+    return True
+
+
+class BoundaryIndex(object):
+    """Run-scoped index of the elements bounding rooms.
+    Every element is resolved once, no matter how many rooms share it,
+    and every type is asked for its decor base once, so Room construction
+    only does dictionary lookups."""
+
+    def __init__(self, doc, cache=None):
+        self.doc = doc
+        self.cache = cache
+        self.elements = {}  # Supposed to be {element_id: Element}
+        self.valid = {}  # Supposed to be {element_id: bool}
+        self.type_ids = {}  # Supposed to be {element_id: type_id}
+        self.decor_bases = {}  # Supposed to be {type_id: decor_base}
+        self.no_decor_base = []  # Ids of valid elements without decor base
+
+    def add(self, element_ids):
+        for el_id in element_ids:
+            host_id = el_id.IntegerValue
+            if host_id in self.valid:
+                continue
+            count('GetElement')
+            instance = self.doc.GetElement(el_id)
+            self.elements[host_id] = instance
+            self.valid[host_id] = is_valid(instance)
+            if not self.valid[host_id]:
+                continue
+            type_id = instance.GetTypeId()
+            self.type_ids[host_id] = type_id.IntegerValue
+            if type_id.IntegerValue not in self.decor_bases:
+                count('GetElement')
+                symbol = Lookuper(self.doc.GetElement(type_id), self.cache)
+                self.decor_bases[type_id.IntegerValue] = \
+                    symbol.Look('CPI_Основа черновой отделки')
+            if not self.decor_bases[type_id.IntegerValue]:
+                self.no_decor_base.append(host_id)
+
+    def inserts(self, cat_names):
+        """Elements of the categories hosted by the valid boundary elements,
+        e.g. doors and windows of the selected rooms only. Ordered like
+        the concatenated collectors of the categories."""
+        from Autodesk.Revit.DB import BuiltInCategory as bic
+        order = dict([(int(getattr(bic, name)), i)
+                      for i, name in enumerate(cat_names)])
+        found = {}  # Supposed to be {element_id: Element}
+        for host_id, host in self.elements.items():
+            if not self.valid[host_id] or not hasattr(host, 'FindInserts'):
+                continue
+            for el_id in host.FindInserts(False, False, False, False):
+                if el_id.IntegerValue in found:
+                    continue
+                count('GetElement')
+                el = self.doc.GetElement(el_id)
+                if el.Category and el.Category.Id.IntegerValue in order:
+                    found[el_id.IntegerValue] = el
+        return sorted(found.values(), key=lambda el: (
+            order[el.Category.Id.IntegerValue], el.Id.IntegerValue))
+
+    def decor_base(self, host_id):
+        return self.decor_bases[self.type_ids[host_id]] or NO_DECOR_BASE
+
+
+class ApertureIndex(object):
+    """Assignment of doors and windows to rooms, built in one pass per phase.
+    Every aperture is asked for its FromRoom/ToRoom once per phase, so the
+    cost of a Room only depends on its own openings."""
+
+    def __init__(self, doc, apertures, phase_ids):
+        # Supposed to be {phase_id: {room_id: {host_id: [aperture]}}}
+        self.by_phase = {}
+        # Supposed to be {phase_id: {aperture_id: (from_room_id, to_room_id)}}
+        self.sides = {}
+        for phase_id in phase_ids:
+            if phase_id.IntegerValue in self.by_phase:
+                continue
+            count('GetElement')
+            self.add_phase(doc.GetElement(phase_id), apertures)
+
+    def add_phase(self, phase, apertures):
+        by_room = self.by_phase[phase.Id.IntegerValue] = {}
+        sides = self.sides[phase.Id.IntegerValue] = {}
+        for ap in apertures:
+            host_id = ap.Host.Id.IntegerValue
+            room_ids = set()
+            from_room, to_room = ap.FromRoom[phase], ap.ToRoom[phase]
+            sides[ap.Id.IntegerValue] = tuple(
+                [room.Id.IntegerValue if room else None
+                 for room in (from_room, to_room)])
+            for room in (from_room, to_room):
+                if not room or room.Id.IntegerValue in room_ids:
+                    continue
+                room_ids.add(room.Id.IntegerValue)
+                if room.Id.IntegerValue not in by_room:
+                    by_room[room.Id.IntegerValue] = {}
+                by_host = by_room[room.Id.IntegerValue]
+                if host_id not in by_host:
+                    by_host[host_id] = []
+                by_host[host_id].append(ap)
+
+    def for_room(self, phase_id, room_id):
+        """Apertures of the room grouped by host: {host_id: [aperture]}."""
+        return self.by_phase.get(phase_id, {}).get(room_id, {})
+
+    def sides_of(self, phase_id):
+        """{aperture_id: (from_room_id, to_room_id)} in the phase"""
+        return self.sides.get(phase_id, {})
+
+
+WIDTHS = ['Ширина', 'Примерная ширина']
+HEIGHTS = ['Высота', 'Примерная высота']
+
+
+class ApertureSizes(object):
+    """Width, height and sill height of doors and windows resolved once
+    per run. Width and height come from the instance if it overrides them,
+    else from the type, which is read once per symbol. Instances of the
+    same type may override different parameters, so every instance is
+    asked for its own. The area is calculated by cpi.decor_engine and kept
+    in the Aperture of the result, which the report reuses."""
+
+    def __init__(self, cache):
+        from Autodesk.Revit.DB import BuiltInParameter
+        self.sill_param = BuiltInParameter.INSTANCE_SILL_HEIGHT_PARAM
+        self.cache = cache
+        self.types = {}  # Supposed to be {symbol_id: (width, height)}
+        self.sizes = {}  # Supposed to be {aperture_id: ApertureData}
+
+    def first(self, el, names):
+        """The first non-zero value of the names, like a chain of 'or'"""
+        value = None
+        for name in names:
+            value = self.cache.look(el, name)
+            if value:
+                return value
+        return value
+
+    def get(self, ap):
+        ap_id = ap.Id.IntegerValue
+        if ap_id in self.sizes:
+            return self.sizes[ap_id]
+        symbol = ap.Symbol
+        symbol_id = symbol.Id.IntegerValue
+        if symbol_id not in self.types:
+            symbol = Lookuper(symbol, self.cache)
+            self.types[symbol_id] = (self.first(symbol, WIDTHS),
+                                     self.first(symbol, HEIGHTS))
+        type_width, type_height = self.types[symbol_id]
+        self.sizes[ap_id] = ApertureData(
+            id=ap_id,
+            width=self.first(ap, WIDTHS) or type_width,
+            height=self.first(ap, HEIGHTS) or type_height,
+            sill_height=ap.get_Parameter(self.sill_param).AsDouble(),
+        )
+        return self.sizes[ap_id]
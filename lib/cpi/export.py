@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Потоковая выгрузка объёмов отделки в CSV и JSON Lines.
+
+Every room is written to the file as soon as it is added, so the export
+keeps nothing but the open file in memory and can replace the HTML
+report on large models. Lengths are in mm and areas in m², rounded the
+same way as in the report."""
+
+import io
+import json
+
+from cpi.core import FEET_TO_MM, F2_TO_M2
+
+FORMATS = ['csv', 'jsonl']
+CSV_DELIMITER = ';'  # Excel с русскими региональными настройками
+CSV_COLUMNS = ['room_id', 'number', 'name', 'kind', 'element_id',
+               'decor_base', 'length_mm', 'height_mm', 'area_m2']
+TEXT = type(u'')
+
+
+def mm(feet_val):
+    return int(round(feet_val * FEET_TO_MM))
+
+
+def sq(sq_feet):
+    return round(sq_feet * F2_TO_M2, 2)
+
+
+def int_id(element_id):
+    return getattr(element_id, 'IntegerValue', element_id)
+
+
+def quantities(room):
+    """Rows of the room: (kind, element_id, decor_base, length_mm,
+    height_mm, area_m2), None where the value does not apply"""
+    yield ('room', None, None, mm(sum([seg.length for seg in room.segments])),
+           mm(room.final_decor_heigth), sq(room.final_decor_area))
+    for base in sorted(room.prep_decor_area):
+        yield ('prep', None, base, None, mm(room.full_heigth),
+               sq(room.prep_decor_area[base]))
+    for seg in room.segments:
+        yield ('segment', int_id(seg.host_id), seg.decor_base, mm(seg.length),
+               mm(room.full_heigth), sq(seg.seg_prep_decor_area))
+        for ap in seg.apertures:
+            yield ('aperture', int_id(ap.Id), seg.decor_base, None, None,
+                   sq(ap.area))
+    yield ('baseboard', None, None, mm(room.baseboard_lenth),
+           mm(room.baseboard_height), None)
+    yield ('guard', None, None, mm(room.guard_lenth), mm(room.guard_height),
+           sq(room.guard_width * room.guard_lenth))
+    yield ('apron', None, None, mm(room.apron_width), mm(room.apron_height),
+           sq(room.apron_area))
+
+
+def room_object(room):
+    """The room as one JSON Lines object with nested segments"""
+    return {
+        'room_id': room.id,
+        'number': room.number,
+        'name': room.name,
+        'final_decor_height_mm': mm(room.final_decor_heigth),
+        'full_height_mm': mm(room.full_heigth),
+        'final_decor_area_m2': sq(room.final_decor_area),
+        'prep_decor_area_m2': dict([(base, sq(area)) for base, area
+                                    in room.prep_decor_area.items()]),
+        'segments': [{
+            'host_id': int_id(seg.host_id),
+            'decor_base': seg.decor_base,
+            'length_mm': mm(seg.length),
+            'prep_area_m2': sq(seg.seg_prep_decor_area),
+            'apertures': [{'id': int_id(ap.Id), 'area_m2': sq(ap.area)}
+                          for ap in seg.apertures],
+        } for seg in room.segments],
+        'baseboard': {'length_mm': mm(room.baseboard_lenth),
+                      'height_mm': mm(room.baseboard_height)},
+        'guard': {'length_mm': mm(room.guard_lenth),
+                  'width_mm': mm(room.guard_width),
+                  'height_mm': mm(room.guard_height),
+                  'area_m2': sq(room.guard_width * room.guard_lenth)},
+        'apron': {'width_mm': mm(room.apron_width),
+                  'height_mm': mm(room.apron_height),
+                  'area_m2': sq(room.apron_area)},
+    }
+
+
+def csv_field(value):
+    if value is None:
+        return u''
+    text = value if isinstance(value, TEXT) else TEXT(value)
+    if any([c in text for c in (CSV_DELIMITER, '"', '\n', '\r')]):
+        return u'"' + text.replace(u'"', u'""') + u'"'
+    return text
+
+
+def csv_line(values):
+    return (CSV_DELIMITER.join([csv_field(v) for v in values]) + u'\r\n') \
+        .encode('utf-8')
+
+
+class QuantityExport(object):
+    """Writes rooms to a CSV or JSON Lines file as they are added.
+    Has the interface of cpi.report.PagedTable: add() inside a with block."""
+
+    def __init__(self, path, fmt='csv'):
+        if fmt not in FORMATS:
+            raise ValueError('Unsupported export format: {}'.format(fmt))
+        self.path = path
+        self.fmt = fmt
+        self.count = 0
+        self.file = None
+
+    def add(self, room):
+        if self.fmt == 'csv':
+            head = [room.id, room.number, room.name]
+            for row in quantities(room):
+                self.file.write(csv_line(head + list(row)))
+        else:
+            self.file.write(json.dumps(room_object(room), sort_keys=True)
+                            .encode('utf-8') + b'\n')
+        self.count += 1
+
+    def __enter__(self):
+        self.file = io.open(self.path, 'wb')
+        if self.fmt == 'csv':
+            self.file.write(u'\ufeff'.encode('utf-8'))  # BOM для Excel
+            self.file.write(csv_line(CSV_COLUMNS))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        self.file = None
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Группировка номеров помещений"""
+
+from cpi.core import natural_key
+
+
+def format_group(prefix, group):
+    """'1.1÷1.5' for a run, '1.1, 1.2' for a pair and '1.1' for a single
+    number; group is a list of bases of the same prefix."""
+    first, last = group[0], group[-1]
+    if prefix:
+        if len(group) == 2:
+            if first == last:
+                return '{0}.{1}'.format(prefix, first)
+            return '{0}.{1}, {0}.{2}'.format(prefix, first, last)
+        if first != last:
+            return '{0}.{1}÷{0}.{2}'.format(prefix, first, last)
+        return '{}.{}'.format(prefix, first)
+    if len(group) == 2:
+        if first == last:
+            return '{}'.format(first)
+        return '{}, {}'.format(first, last)
+    if first != last:
+        return '{}÷{}'.format(first, last)
+    return '{}'.format(first)
+
+
+class NumberTrie(object):
+    """Room numbers of a run indexed by level (building.floor.room).
+    Every distinct number is a path of the trie and every level a node,
+    so numbers of the same parent node are siblings whatever their depth:
+    '1.2.5' is grouped with '1.2.6', '1.01а' with '1.01'. Numbers are
+    naturally sorted and split once for all rooms, group() of a bucket
+    then only sorts integer ranks."""
+
+    def __init__(self, numbers):
+        self.numbers = numbers
+        self.parent = [None]  # Parent node by node, 0 is the root
+        self.label = ['']  # Text of the level by node
+        self.value = [None]  # int of a purely digital level or None
+        self.prefix = ['']  # Number of the node itself, prefix of children
+        children = {}  # Supposed to be {(parent node, label): node}
+        self.node = []  # Node by room index
+        for number in numbers:
+            node = 0
+            for label in number.split('.'):
+                key = (node, label)
+                if key not in children:
+                    children[key] = len(self.parent)
+                    self.parent.append(node)
+                    self.label.append(label)
+                    self.value.append(int(label) if label.isdigit()
+                                      else None)
+                    self.prefix.append('{}.{}'.format(self.prefix[node],
+                                                      label)
+                                       if node else label)
+                node = children[key]
+            self.node.append(node)
+        order = sorted(range(len(numbers)),
+                       key=lambda i: natural_key(numbers[i]))
+        self.rank = [0] * len(numbers)
+        for rank, i in enumerate(order):
+            self.rank[i] = rank
+
+    def group(self, indexes, simple=False):
+        """Grouped string of the numbers of rooms by their indexes, e.g.
+        '1.2.1÷1.2.9, 1.3.1÷1.3.4'. Consecutive digital levels of a parent
+        node with more than two numbers are collapsed into runs; a level
+        with letters ('01а') always ends a run."""
+        ordered = sorted(indexes, key=self.rank.__getitem__)
+        by_parent = {}  # Supposed to be {parent node: [position]}
+        for position, i in enumerate(ordered):
+            parent = self.parent[self.node[i]]
+            if parent not in by_parent:
+                by_parent[parent] = []
+            by_parent[parent].append(position)
+        starts = [None] * len(ordered)  # Groups by position of their first
+        for parent, positions in by_parent.items():
+            group = previous = None
+            for position in positions:
+                node = self.node[ordered[position]]
+                value = self.value[node]
+                if group is None or simple or len(positions) > 2 and (
+                        value is None or previous is None
+                        or value != previous + 1):
+                    group = starts[position] = (self.prefix[parent], [])
+                group[1].append(self.label[node])
+                previous = value
+        results = []
+        seen = set()  # Numbers that have already started a group
+        for position, group in enumerate(starts):
+            if group is None:
+                continue
+            number = self.numbers[ordered[position]]
+            if len(group[1]) == 1 and number in seen:
+                continue
+            seen.add(number)
+            results.append(format_group(*group))
+        return ', '.join(results)
+
+
+def group_numbers(numbers, simple=False):
+    """Grouped string of room numbers, e.g. '1.1÷1.5, 1.7, 2.1, 2.2'.
+    To group several buckets of the same rooms build one NumberTrie and
+    call its group() for every bucket."""
+    return NumberTrie(numbers).group(range(len(numbers)), simple)
+
+
+class GroupingPlan(object):
+    """TABLE of the grouping script compiled once.
+    Every distinct source parameter gets one column of the room × parameter
+    matrix, so each value is read once per room no matter how many targets
+    use it, and the kind keys of all targets are derived from the matrix."""
+
+    def __init__(self, table, excluded_names):
+        self.targets = [target for target, sources in table]
+        self.sources = []  # Distinct source parameters
+        self.columns = []  # Supposed to be [[column of source]] by target
+        for target, sources in table:
+            for source in sources:
+                if source not in self.sources:
+                    self.sources.append(source)
+            self.columns.append([self.sources.index(source)
+                                 for source in sources])
+        self.excluded_names = excluded_names
+
+    def read(self, rooms, look):
+        """Matrix of str values of the sources, the last column is the
+        excluded flag of the room; look(room, name) reads a parameter."""
+        rows = []
+        for room in rooms:
+            row = [str(look(room, source)) for source in self.sources]
+            room_name = look(room, 'Имя')
+            row.append(str(any([name in room_name
+                                for name in self.excluded_names])))
+            rows.append(row)
+        return rows
+
+    def kinds(self, row):
+        """Kind key of the room for every target"""
+        return [' + '.join([self.sources[column] + row[column]
+                            for column in columns]) + row[-1]
+                for columns in self.columns]
+
+    def buckets(self, rows):
+        """Indexes of rooms grouped by kind: [{kind: [index]}] by target"""
+        buckets = [{} for target in self.targets]
+        for index, row in enumerate(rows):
+            for rooms_by_kind, kind in zip(buckets, self.kinds(row)):
+                if kind not in rooms_by_kind:
+                    rooms_by_kind[kind] = []
+                rooms_by_kind[kind].append(index)
+        return buckets
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Кэширующее чтение параметров элементов"""
+
+from cpi.probe import count
+
+# Supposed to be {str(StorageType): name of Parameter method}
+GETTERS = {
+    'Double': 'AsDouble',
+    'String': 'AsString',
+    'ElementId': 'AsElementId',
+    'Integer': 'AsInteger',
+}
+
+
+def lookup(el, name):
+    """el.LookupParameter(name), counted for the probe"""
+    count('LookupParameter')
+    return el.LookupParameter(name)
+
+
+def value_of(param, getter=None):
+    """Value of the Parameter according to its storage type."""
+    if not param:
+        return None
+    getter = getter or GETTERS.get(str(param.StorageType))
+    return getattr(param, getter)() if getter else None
+
+
+def type_key(el):
+    """Key of the element type: parameter definitions are shared by all
+    instances of a type (or of a category for elements without a type)."""
+    type_id = el.GetTypeId().IntegerValue
+    if type_id > 0:
+        return type_id
+    category = el.Category
+    return 'cat', category.Id.IntegerValue if category else None
+
+
+class ParamCache(object):
+    """Run-scoped memo of parameter values.
+    Every value is read with a single LookupParameter call, the storage type
+    of each parameter name is resolved once per element type. Values are kept
+    until the end of the run, so the cache must be created by the script
+    itself and not shared between clicks."""
+
+    def __init__(self):
+        self.values = {}  # Supposed to be {(element_id, name): value}
+        self.getters = {}  # Supposed to be {(type_key, name): getter name}
+        self.hits = 0
+        self.misses = 0
+
+    def look(self, el, name):
+        key = el.Id.IntegerValue, name
+        if key in self.values:
+            self.hits += 1
+            return self.values[key]
+        self.misses += 1
+        value = self.values[key] = self.read(el, name)
+        return value
+
+    def read(self, el, name):
+        param = lookup(el, name)
+        if not param:
+            return None
+        kind = type_key(el), name
+        if kind not in self.getters:
+            self.getters[kind] = GETTERS.get(str(param.StorageType))
+        getter = self.getters[kind]
+        return getattr(param, getter)() if getter else None
+
+    def put(self, el, name, value):
+        """Memoize a value the caller has already read or just written"""
+        self.values[el.Id.IntegerValue, name] = value
+
+    def invalidate(self, el=None):
+        """Drop memoized values of the element (of all elements if None)."""
+        if el is None:
+            self.values.clear()
+            return
+        el_id = el.Id.IntegerValue
+        for key in [k for k in self.values if k[0] == el_id]:
+            del self.values[key]
+
+    def stats(self):
+        return 'Чтений параметров: {}, из кэша: {}, обращений к Revit: {}' \
+            .format(self.hits + self.misses, self.hits, self.misses)
+
+
+class Lookuper(object):  # https://stackoverflow.com/a/16185009
+    """Wrapper for adding a bit of syntactic sugar to Elements.
+    Allows to use the new method "el.Look" instead of a bulky
+    "el.LookupParameter", due to it's unhandiness in term of necessity
+    of thinkig about the type of a returning value.
+    Values are memoized in the ParamCache if one is given."""
+
+    def __init__(self, obj, cache=None):
+        self.obj = obj
+        self.cache = cache
+
+    def Look(self, name):
+        if self.cache is None:
+            return value_of(lookup(self.obj, name))
+        return self.cache.look(self.obj, name)
+
+    def __getattr__(self, name):
+        return getattr(self.obj, name)
+
+    def __repr__(self):
+        return self.obj.__repr__() + '*'
+
+    def __str__(self):
+        return self.obj.__repr__() + '**'
+
+
+TOLERANCE = 1e-6  # Погрешность сравнения чисел при записи, в единицах Revit
+
+
+class ParamWriter(object):
+    """Writes parameter values only if they differ from the stored ones.
+    Every untouched parameter keeps the element out of the transaction,
+    the undo record and the next synchronization with central."""
+
+    def __init__(self, tolerance=TOLERANCE):
+        self.tolerance = tolerance
+        self.written = {}  # Supposed to be {param_name: count}
+        self.skipped = {}  # Supposed to be {param_name: count}
+
+    def same(self, current, value):
+        if isinstance(current, float) and isinstance(value, (int, float)):
+            return abs(current - value) <= self.tolerance
+        if current is None and value == '':
+            return True
+        return current == value
+
+    def set(self, el, name, value):
+        """True if written, False if unchanged, None if there is no
+        such parameter."""
+        param = lookup(el, name)
+        if not param:
+            return None
+        return self.set_param(param, name, value)
+
+    def set_param(self, param, name, value):
+        counts = self.written
+        if param.HasValue and self.same(value_of(param), value):
+            counts = self.skipped
+        else:
+            param.Set(value)
+        counts[name] = counts.get(name, 0) + 1
+        return counts is self.written
+
+    def stats(self):
+        return 'Записано параметров: {}, без изменений: {}' \
+            .format(sum(self.written.values()), sum(self.skipped.values()))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Замер задержки запуска кнопок и горячих мест расчёта"""
+
+import io
+import json
+from timeit import default_timer as clock
+
+calls = {}  # Supposed to be {Revit API method: count}, reset by StartupProbe
+
+
+def count(method, n=1):
+    """Count calls of a Revit API method. Called right next to every call:
+    LookupParameter goes through cpi.params.lookup, GetElement and
+    GetBoundarySegments are counted where they are called, so the counts
+    are exact. A dict increment is negligible next to the API call, so
+    the counters stay on and are only reported on demand."""
+    calls[method] = calls.get(method, 0) + n
+
+
+class Timing(object):
+    """Context manager adding the wall time of its block to an item."""
+
+    def __init__(self, costs, item):
+        self.costs = costs
+        self.item = item
+
+    def __enter__(self):
+        self.started = clock()
+        return self
+
+    def __exit__(self, *args):
+        self.costs[self.item] = \
+            self.costs.get(self.item, 0) + clock() - self.started
+
+
+class StartupProbe(object):
+    """Splits the wall time of a run into consecutive phases.
+    Create it as the very first statement of a script and call mark()
+    at the end of every phase, e.g. 'Импорт', 'Подготовка', 'Расчёт'.
+    It also collects the cost of single items (rooms, targets), the sizes
+    of transactions and the API call counters for summary() and dump()."""
+
+    def __init__(self):
+        self.started = self.last = clock()
+        self.phases = []  # Supposed to be [(phase, seconds)]
+        self.costs = {}  # Supposed to be {item: seconds}
+        self.transactions = []  # Supposed to be [(name, written values)]
+        calls.clear()
+
+    def mark(self, phase):
+        now = clock()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def timing(self, item):
+        return Timing(self.costs, item)
+
+    def transaction(self, name, size):
+        self.transactions.append((name, size))
+
+    def slowest(self, n=5):
+        """[(item, seconds)] of the n most expensive items"""
+        return sorted(self.costs.items(), key=lambda c: -c[1])[:n]
+
+    def report(self):
+        return ', '.join(['{}: {:.3f} с'.format(phase, seconds)
+                          for phase, seconds in self.phases]
+                         + ['всего: {:.3f} с'.format(self.last - self.started)])
+
+    def summary(self, slowest=5):
+        lines = [self.report()]
+        if calls:
+            lines.append('Вызовы API: ' + ', '.join(
+                ['{}: {}'.format(method, calls[method])
+                 for method in sorted(calls)]))
+        if self.transactions:
+            lines.append('Транзакции: ' + ', '.join(
+                ['{}: {}'.format(name, size)
+                 for name, size in self.transactions]))
+        if self.costs:
+            lines.append('Самые долгие: ' + ', '.join(
+                ['{}: {:.3f} с'.format(item, seconds)
+                 for item, seconds in self.slowest(slowest)]))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """Write the trace as JSON, False if the file is not writable."""
+        trace = {
+            'phases': self.phases,
+            'total': self.last - self.started,
+            'calls': calls,
+            'transactions': self.transactions,
+            'costs': self.slowest(len(self.costs)),
+        }
+        try:
+            with io.open(path, 'wb') as f:
+                f.write(json.dumps(trace, indent=1)
+                        .encode('utf-8'))
+        except (IOError, OSError):
+            return False
+        return True
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Постраничный вывод отчётов"""
+
+
+class PagedTable(object):
+    """Table printed page by page while its items are being produced.
+    An item is rendered into a row (with all its links) only when its page
+    is printed, so no more than one page is kept in memory and the first
+    page appears as soon as it is full."""
+
+    def __init__(self, output, columns, render, page_size=10):
+        self.output = output
+        self.columns = columns
+        self.render = render  # Supposed to be render(item, index) -> row
+        self.page_size = page_size
+        self.items = []
+        self.count = 0
+
+    def add(self, item):
+        self.items.append(item)
+        if len(self.items) >= self.page_size:
+            self.flush()
+
+    def flush(self):
+        if not self.items:
+            return
+        rows = [self.render(item, self.count + i)
+                for i, item in enumerate(self.items)]
+        self.count += len(self.items)
+        self.items = []
+        self.output.print_table(table_data=rows, columns=self.columns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""Бинарный колоночный снимок помещений.
+
+Everything the finishing calculation and the number grouping need from a
+project is written once into a versioned binary file: every room in scope
+with its area and CPI_Подсчёт отделки, room fields, extra room parameters
+(CPI_*) typed by their storage, boundary segments with decor bases and
+lengths, apertures with sizes, sills and from/to rooms. Every column is a
+flat little-endian array; texts are kept once in a shared string table.
+Element ids are 64-bit; interpreters without array('q') (Python 2) write
+them as 32-bit and reject larger ids with ValueError.
+
+The loader memory-maps the file and exposes the columns as typed
+memoryviews, so opening a snapshot costs a header parse regardless of
+its size. Interpreters without memoryview.cast (IronPython, Python 2)
+copy the columns into arrays instead.
+
+    cd lib
+    python -m cpi.decor_batch project1.cpi_snapshot.bin ...
+"""
+
+import io
+import json
+import math
+import struct
+import sys
+from array import array
+
+from cpi.decor_columns import SegmentTable
+from cpi.decor_engine import ApertureData, RoomData, SegmentData
+
+MAGIC = b'CPISNAP\0'
+VERSION = 2
+SUFFIX = '.cpi_snapshot.bin'
+PREAMBLE = struct.Struct('<8sII')  # magic, version, length of the header
+ALIGN = 8
+NONE = -1  # None of int columns and of string indexes
+INT_NONE = -2 ** 31  # None of Integer and ElementId parameters
+try:
+    ID_TYPECODE = array('q').typecode  # ElementId бывает 64-битным
+except ValueError:  # В Python 2 нет 'q', id проверяются на int32
+    ID_TYPECODE = 'i'
+
+# Supposed to be [(RoomData field, typecode)], the rest is segments and id
+ROOM_FIELDS = [
+    ('full_heigth', 'd'),
+    ('ceiling_heigth', 'd'),
+    ('baseboard_on', 'b'),
+    ('baseboard_height', 'd'),
+    ('guard_on', 'b'),
+    ('guard_width', 'd'),
+    ('guard_height', 'd'),
+    ('guard_reserve', 'd'),
+    ('apron_on', 'b'),
+    ('apron_width', 'd'),
+    ('apron_height', 'd'),
+]
+# Supposed to be {str(StorageType): typecode}, the rest is string indexes
+PARAM_TYPECODES = {
+    'Double': 'd',
+    'Integer': 'i',
+    'ElementId': ID_TYPECODE,
+}
+# Supposed to be [(column of SegmentTable, typecode)]
+TABLE_COLUMNS = [
+    ('seg_start', 'i'),
+    ('length', 'd'),
+    ('base', 'i'),
+    ('host_id', ID_TYPECODE),
+    ('ap_start', 'i'),
+    ('ap_id', ID_TYPECODE),
+    ('width', 'd'),
+    ('height', 'd'),
+    ('sill_height', 'd'),
+]
+
+
+def to_column(typecode, values, empty=None):
+    """Array of the values, None is stored as NaN or NONE"""
+    if empty is None:
+        empty = float('nan') if typecode == 'd' else NONE
+    try:
+        return array(typecode, [empty if value is None else value
+                                for value in values])
+    except OverflowError:
+        if typecode != ID_TYPECODE:
+            raise
+        raise ValueError('ElementId does not fit into 32 bits, the snapshot '
+                         'needs an interpreter with 64-bit arrays')
+
+
+def from_value(typecode, value):
+    if typecode == 'd':
+        return None if math.isnan(value) else value
+    return None if value == NONE else value
+
+
+def param_column(storage, values, strings):
+    """Array of the parameter values by its storage type: Double as is,
+    Integer and ElementId (its IntegerValue) as ints, texts as indexes
+    into the string table"""
+    if storage == 'Double':
+        return to_column('d', values)
+    if storage in PARAM_TYPECODES:
+        return to_column(PARAM_TYPECODES[storage], values, INT_NONE)
+    return to_column('i', [strings.add(value) for value in values])
+
+
+class Strings(object):
+    """String table being written: every distinct text is stored once."""
+
+    def __init__(self):
+        self.index = {}  # Supposed to be {text: position}
+        self.data = []  # Encoded texts
+
+    def add(self, text):
+        if text is None:
+            return NONE
+        if text not in self.index:
+            self.index[text] = len(self.data)
+            self.data.append(text.encode('utf-8'))
+        return self.index[text]
+
+    def columns(self):
+        offsets = array('i', [0])
+        for data in self.data:
+            offsets.append(offsets[-1] + len(data))
+        return offsets, array('B', b''.join(self.data))
+
+
+def save(path, rooms, guard_threshold, sides=None, params=None,
+         areas=None, enabled=None):
+    """Write the RoomData as a binary snapshot, False if the file is not
+    writable. sides is {aperture_id: (from_room_id, to_room_id)}, params
+    is {name: (str(StorageType), [value by room])} of extra room
+    parameters, ElementId values given by IntegerValue. areas and enabled
+    (CPI_Подсчёт отделки) are by room; rooms without them are calculated."""
+    sides = sides or {}
+    params = params or {}
+    areas = areas or [None] * len(rooms)
+    enabled = enabled or [1] * len(rooms)
+    table = SegmentTable(rooms)
+    strings = Strings()
+    columns = [  # Supposed to be [(name, array)]
+        ('room.id', to_column(ID_TYPECODE, [room.id for room in rooms])),
+        ('room.number', to_column('i', [strings.add(room.number)
+                                        for room in rooms])),
+        ('room.name', to_column('i', [strings.add(room.name)
+                                      for room in rooms])),
+        ('room.area', to_column('d', areas)),
+        ('room.enabled', to_column('b', enabled)),
+    ]
+    for field, typecode in ROOM_FIELDS:
+        columns.append(('room.' + field, to_column(
+            typecode, [getattr(room, field) for room in rooms])))
+    for name in sorted(params):
+        storage, values = params[name]
+        columns.append(('param.' + name,
+                        param_column(storage, values, strings)))
+    for name, typecode in TABLE_COLUMNS:
+        columns.append(('table.' + name, to_column(
+            typecode, getattr(table, name))))
+    for n, name in enumerate(['from_room', 'to_room']):
+        columns.append(('ap.' + name, to_column(
+            ID_TYPECODE, [sides.get(ap_id, (None, None))[n]
+                          for ap_id in table.ap_id])))
+    offsets, data = strings.columns()
+    columns += [('strings.offset', offsets), ('strings.data', data)]
+
+    layout = []  # Supposed to be [[name, typecode, offset, length]]
+    offset = 0
+    for name, column in columns:
+        layout.append([name, column.typecode, offset, len(column)])
+        offset += len(column) * column.itemsize
+        offset += -offset % ALIGN
+    header = json.dumps({
+        'byteorder': 'little',
+        'guard_threshold': guard_threshold,
+        'rooms': len(rooms),
+        'bases': table.bases,
+        'params': dict([(name, storage)
+                        for name, (storage, values) in params.items()]),
+        'columns': layout,
+    }).encode('utf-8')
+    header += b' ' * (-(PREAMBLE.size + len(header)) % ALIGN)
+    try:
+        with io.open(path, 'wb') as f:
+            f.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+            f.write(header)
+            for name, column in columns:
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                data = column.tostring() if sys.version_info[0] < 3 \
+                    else column.tobytes()
+                f.write(data + b'\0' * (-len(data) % ALIGN))
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def is_snapshot(path):
+    """Whether the file is a binary snapshot, judging by its magic"""
+    with io.open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class Snapshot(object):
+    """Binary snapshot opened for reading. Columns are typed sequences
+    over the mapped file: snapshot['table.length'], snapshot['room.id'];
+    strings and None values are resolved by the accessors. Rooms with zero
+    area or with CPI_Подсчёт отделки off have no segments."""
+
+    def __init__(self, path):
+        self.path = path
+        self.views = []  # Released by close() before the map is closed
+        self.columns = {}  # Supposed to be {name: sequence}
+        self.file = io.open(path, 'rb')
+        try:
+            import mmap
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        except (ImportError, EnvironmentError):  # Без mmap файл читается
+            self.map = self.file.read()
+        magic, version, size = PREAMBLE.unpack(self.map[:PREAMBLE.size])
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('Unsupported snapshot: {}'.format(path))
+        start = PREAMBLE.size + size
+        header = json.loads(self.map[PREAMBLE.size:start].decode('utf-8'))
+        if header['byteorder'] != sys.byteorder:
+            self.close()
+            raise ValueError('Snapshot byte order differs: {}'.format(path))
+        self.guard_threshold = header['guard_threshold']
+        self.rooms = header['rooms']
+        self.bases = header['bases']
+        self.params = header['params']  # Supposed to be {name: storage}
+        typecodes = set([column[1] for column in header['columns']])
+        if 'q' in typecodes and ID_TYPECODE != 'q':
+            self.close()
+            raise ValueError('Snapshot has 64-bit ids, unsupported by this '
+                             'interpreter: {}'.format(path))
+        buffer = memoryview(self.map) if hasattr(memoryview, 'cast') \
+            else None
+        for name, typecode, offset, length in header['columns']:
+            first = start + offset
+            last = first + length * array(typecode).itemsize
+            if buffer is None:
+                self.columns[name] = array(typecode, self.map[first:last])
+                continue
+            view = buffer[first:last]
+            self.columns[name] = view.cast(typecode)
+            self.views += [view, self.columns[name]]
+        if buffer is not None:
+            self.views.append(buffer)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def string(self, index):
+        if index == NONE:
+            return None
+        offsets = self.columns['strings.offset']
+        data = self.columns['strings.data'][offsets[index]:offsets[index + 1]]
+        return (data.tobytes() if hasattr(data, 'tobytes')
+                else data.tostring()).decode('utf-8')
+
+    def number(self, i):
+        return self.string(self.columns['room.number'][i])
+
+    def name(self, i):
+        return self.string(self.columns['room.name'][i])
+
+    def area(self, i):
+        return from_value('d', self.columns['room.area'][i])
+
+    def enabled(self, i):
+        """Whether room i is calculated: CPI_Подсчёт отделки and area"""
+        area = self.area(i)
+        return bool(self.columns['room.enabled'][i]) \
+            and (area is None or area > 0)
+
+    def look(self, i, name):
+        """Parameter of room i by its name, like Lookuper.Look; ElementId
+        parameters are given by IntegerValue"""
+        if name == 'Номер':
+            return self.number(i)
+        if name == 'Имя':
+            return self.name(i)
+        storage = self.params.get(name)
+        if storage is None:
+            return None
+        value = self.columns['param.' + name][i]
+        if storage == 'Double':
+            return from_value('d', value)
+        if storage in PARAM_TYPECODES:
+            return None if value == INT_NONE else value
+        return self.string(value)
+
+    def sides(self, k):
+        """(from_room_id, to_room_id) of aperture k of the table"""
+        return (from_value(ID_TYPECODE, self.columns['ap.from_room'][k]),
+                from_value(ID_TYPECODE, self.columns['ap.to_room'][k]))
+
+    def room_data(self, segments=True):
+        """RoomData of all rooms; without segments is enough for
+        SegmentTable, which takes them from the columns."""
+        fields = [(field, typecode, self.columns['room.' + field])
+                  for field, typecode in ROOM_FIELDS]
+        rooms = []
+        for i in range(self.rooms):
+            values = dict([(field, from_value(typecode, column[i]))
+                           for field, typecode, column in fields])
+            rooms.append(RoomData(
+                id=self.columns['room.id'][i],
+                number=self.number(i),
+                name=self.name(i),
+                segments=self.segments(i) if segments else None,
+                **values))
+        return rooms
+
+    def segments(self, i):
+        c = self.columns
+        starts, ap_starts = c['table.seg_start'], c['table.ap_start']
+        return [SegmentData(
+            host_id=c['table.host_id'][j],
+            length=c['table.length'][j],
+            decor_base=self.bases[c['table.base'][j]],
+            apertures=[ApertureData(
+                id=c['table.ap_id'][k],
+                width=from_value('d', c['table.width'][k]),
+                height=from_value('d', c['table.height'][k]),
+                sill_height=from_value('d', c['table.sill_height'][k]),
+            ) for k in range(ap_starts[j], ap_starts[j + 1])],
+        ) for j in range(starts[i], starts[i + 1])]
+
+    def table(self):
+        """SegmentTable over the mapped columns without copying them"""
+        return SegmentTable.from_columns(
+            self.room_data(segments=False), self.bases,
+            dict([(name, self.columns['table.' + name])
+                  for name, typecode in TABLE_COLUMNS]))
+
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.columns = {}
+        if hasattr(self.map, 'close'):
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()